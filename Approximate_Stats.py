@@ -0,0 +1,293 @@
+import math
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from Data_Loader import iter_merged_frames
+
+
+class Reservoir:
+    """Uniform sample of at most `size` rows of a stream (Vitter's algorithm R, one batch at a time)."""
+
+    def __init__(self, size=10000, seed=0):
+        self.size = size
+        self.seen = 0
+        self.rows = []
+        self.rng = np.random.default_rng(seed)
+
+    def extend(self, rows):
+        start = 0
+        if len(self.rows) < self.size:
+            start = min(self.size - len(self.rows), len(rows))
+            self.rows.extend(rows[:start])
+            self.seen += start
+        if start == len(rows):
+            return
+        # Row number seen+i+1 replaces a random slot with probability size / (seen+i+1)
+        positions = self.rng.integers(0, np.arange(self.seen + 1, self.seen + len(rows) - start + 1))
+        for offset in np.flatnonzero(positions < self.size):
+            self.rows[positions[offset]] = rows[start + offset]
+        self.seen += len(rows) - start
+
+
+class HyperLogLog:
+    """Distinct count estimate with relative standard error `error` (2**p one-byte registers)."""
+
+    def __init__(self, error=0.01):
+        self.p = min(18, max(4, math.ceil(math.log2((1.04 / error) ** 2))))
+        self.m = 1 << self.p
+        self.registers = np.zeros(self.m, dtype=np.uint8)
+
+    def add(self, values):
+        hashes = pd.util.hash_array(np.asarray(values, dtype=object))
+        index = (hashes >> np.uint64(64 - self.p)).astype(np.int64)
+        rest = hashes & np.uint64((1 << (64 - self.p)) - 1)
+        # Rank of the first set bit in the remaining 64-p bits (64-p+1 when they are all zero)
+        bit_length = np.frexp(rest.astype(np.float64))[1]
+        rank = (64 - self.p - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self):
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m ** 2 / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * self.m and zeros:
+            # Linear counting is more accurate while many registers are still empty
+            estimate = self.m * math.log(self.m / zeros)
+        return int(round(estimate))
+
+
+class QuantileSketch:
+    """Merging t-digest: quantiles with rank error of roughly `error`, most accurate in the tails."""
+
+    def __init__(self, error=0.01, buffer_size=10000):
+        self.compression = max(20, math.ceil(2 / error))
+        self.buffer_size = buffer_size
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.buffer = []
+        self.buffered = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self.buffer.append(values)
+        self.buffered += len(values)
+        if self.buffered >= self.buffer_size:
+            self._compress()
+
+    def _k(self, q):
+        return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+    def _k_inverse(self, k):
+        return (math.sin(min(k * 2 * math.pi / self.compression, math.pi / 2)) + 1) / 2
+
+    def _compress(self):
+        if not self.buffer:
+            return
+        # Repeated values (counts, months) collapse into one weighted point before merging
+        values, counts = np.unique(np.concatenate(self.buffer), return_counts=True)
+        means = np.concatenate([self.means, values])
+        weights = np.concatenate([self.weights, counts.astype(np.float64)])
+        order = np.argsort(means, kind='stable')
+        means, weights = means[order], weights[order]
+        self.buffer, self.buffered = [], 0
+
+        total = weights.sum()
+        merged_means, merged_weights = [means[0]], [weights[0]]
+        cumulative = weights[0]
+        q_limit = self._k_inverse(self._k(0) + 1)
+        for mean, weight in zip(means[1:], weights[1:]):
+            if (cumulative + weight) / total <= q_limit:
+                merged_weights[-1] += weight
+                merged_means[-1] += (mean - merged_means[-1]) * weight / merged_weights[-1]
+            else:
+                q_limit = self._k_inverse(self._k(cumulative / total) + 1)
+                merged_means.append(mean)
+                merged_weights.append(weight)
+            cumulative += weight
+        self.means, self.weights = np.array(merged_means), np.array(merged_weights)
+
+    def quantile(self, q):
+        self._compress()
+        if not len(self.means):
+            return math.nan
+        # Interpolate between centroid centres, anchored at the exact minimum and maximum
+        centres = np.cumsum(self.weights) - self.weights / 2
+        positions = np.concatenate([[0], centres, [self.weights.sum()]])
+        values = np.concatenate([[self.min], self.means, [self.max]])
+        return float(np.interp(q * self.weights.sum(), positions, values))
+
+
+class Moments:
+    """Count, mean, variance, skewness and kurtosis of a stream, merged batch by batch (Pébay)."""
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = self.m3 = self.m4 = 0.0
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        n_b = len(values)
+        mean_b = values.mean()
+        centred = values - mean_b
+        m2_b, m3_b, m4_b = (centred ** 2).sum(), (centred ** 3).sum(), (centred ** 4).sum()
+
+        n_a, n = self.n, self.n + n_b
+        delta = mean_b - self.mean
+        self.m4 += (m4_b + delta ** 4 * n_a * n_b * (n_a ** 2 - n_a * n_b + n_b ** 2) / n ** 3
+                    + 6 * delta ** 2 * (n_a ** 2 * m2_b + n_b ** 2 * self.m2) / n ** 2
+                    + 4 * delta * (n_a * m3_b - n_b * self.m3) / n)
+        self.m3 += (m3_b + delta ** 3 * n_a * n_b * (n_a - n_b) / n ** 2
+                    + 3 * delta * (n_a * m2_b - n_b * self.m2) / n)
+        self.m2 += m2_b + delta ** 2 * n_a * n_b / n
+        self.mean += delta * n_b / n
+        self.n = n
+
+    def std(self):
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else math.nan
+
+    def skew(self):
+        # Same bias-corrected estimator as pandas' Series.skew
+        n = self.n
+        if n < 3 or self.m2 == 0:
+            return math.nan
+        g1 = math.sqrt(n) * self.m3 / self.m2 ** 1.5
+        return math.sqrt(n * (n - 1)) / (n - 2) * g1
+
+    def kurt(self):
+        # Same bias-corrected excess kurtosis as pandas' Series.kurt
+        n = self.n
+        if n < 4 or self.m2 == 0:
+            return math.nan
+        g2 = n * self.m4 / self.m2 ** 2 - 3
+        return ((n + 1) * g2 + 6) * (n - 1) / ((n - 2) * (n - 3))
+
+
+class CoMoments:
+    """Streaming pairwise correlations; like DataFrame.corr, each pair uses the rows where both are present."""
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        shape = (len(self.columns), len(self.columns))
+        # Per pair (i, j): row count, means of i and j, and the centred sums of squares and products
+        self.n = np.zeros(shape)
+        self.mean_x, self.mean_y = np.zeros(shape), np.zeros(shape)
+        self.sxx, self.syy, self.sxy = np.zeros(shape), np.zeros(shape), np.zeros(shape)
+
+    def add(self, matrix):
+        matrix = np.asarray(matrix, dtype=np.float64)
+        valid = ~np.isnan(matrix)
+        for i in range(len(self.columns)):
+            for j in range(i, len(self.columns)):
+                both = valid[:, i] & valid[:, j]
+                n_b = np.count_nonzero(both)
+                if not n_b:
+                    continue
+                x, y = matrix[both, i], matrix[both, j]
+                mean_x, mean_y = x.mean(), y.mean()
+                n_a, n = self.n[i, j], self.n[i, j] + n_b
+                delta_x, delta_y = mean_x - self.mean_x[i, j], mean_y - self.mean_y[i, j]
+                factor = n_a * n_b / n
+                self.sxx[i, j] += ((x - mean_x) ** 2).sum() + delta_x ** 2 * factor
+                self.syy[i, j] += ((y - mean_y) ** 2).sum() + delta_y ** 2 * factor
+                self.sxy[i, j] += ((x - mean_x) * (y - mean_y)).sum() + delta_x * delta_y * factor
+                self.mean_x[i, j] += delta_x * n_b / n
+                self.mean_y[i, j] += delta_y * n_b / n
+                self.n[i, j] = n
+
+    def corr(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            upper = self.sxy / np.sqrt(self.sxx * self.syy)
+        upper[self.n < 2] = np.nan
+        correlation = np.triu(upper) + np.triu(upper, 1).T
+        return pd.DataFrame(correlation, index=self.columns, columns=self.columns)
+
+
+class ApproximateOverview:
+    """One pass over per-user rows: exact counts and ranges, sketched distinct counts, quantiles and moments."""
+
+    def __init__(self, fields, numeric_fields, sample_size=10000, distinct_error=0.01, quantile_error=0.01, seed=0):
+        self.fields = list(fields)
+        self.numeric_fields = list(numeric_fields)
+        self.rows = 0
+        self.missing = Counter()
+        self.label_counts = Counter()
+        self.created_at = [None, None]
+        self.distinct = {field: HyperLogLog(distinct_error) for field in self.fields}
+        self.quantiles = {field: QuantileSketch(quantile_error) for field in self.numeric_fields}
+        self.moments = {field: Moments() for field in self.numeric_fields}
+        self.comoments = CoMoments(self.numeric_fields)
+        self.reservoir = Reservoir(sample_size, seed)
+
+    def add(self, frame):
+        self.rows += len(frame)
+        self.missing.update(frame.isnull().sum().to_dict())
+        if 'label' in frame:
+            self.label_counts.update(frame['label'].dropna().tolist())
+        if 'created_at' in frame:
+            created_at = frame['created_at'].dropna()
+            if len(created_at):
+                low, high = created_at.min(), created_at.max()
+                self.created_at = [low if self.created_at[0] is None else min(low, self.created_at[0]),
+                                   high if self.created_at[1] is None else max(high, self.created_at[1])]
+        for field in self.fields:
+            values = frame[field]
+            # Lists are compared by their string form, like the exact overview does
+            if values.dtype == object and values.map(lambda x: isinstance(x, list)).any():
+                values = values.astype(str)
+            self.distinct[field].add(values.dropna().to_numpy(dtype=object))
+        # Missing values of the nullable integer columns become NaN
+        numeric = frame[self.numeric_fields].to_numpy(dtype=np.float64, na_value=np.nan)
+        for column, field in enumerate(self.numeric_fields):
+            self.quantiles[field].add(numeric[:, column])
+            self.moments[field].add(numeric[:, column])
+        self.comoments.add(numeric)
+        self.reservoir.extend(frame.to_dict(orient='records'))
+
+    def describe(self):
+        """Approximation of DataFrame.describe() for the numeric fields."""
+        stats = {}
+        for field in self.numeric_fields:
+            moments, quantiles = self.moments[field], self.quantiles[field]
+            stats[field] = {
+                'count': moments.n, 'mean': moments.mean if moments.n else math.nan, 'std': moments.std(),
+                'min': quantiles.min if moments.n else math.nan,
+                '25%': quantiles.quantile(0.25), '50%': quantiles.quantile(0.5), '75%': quantiles.quantile(0.75),
+                'max': quantiles.max if moments.n else math.nan,
+            }
+        return pd.DataFrame(stats)
+
+    def skew(self):
+        return pd.Series({field: self.moments[field].skew() for field in self.numeric_fields})
+
+    def kurt(self):
+        return pd.Series({field: self.moments[field].kurt() for field in self.numeric_fields})
+
+    def distinct_counts(self):
+        return {field: self.distinct[field].count() for field in self.fields}
+
+    def sample(self):
+        return pd.DataFrame(self.reservoir.rows, columns=self.fields)
+
+
+def approximate_overview(db, fields, numeric_fields, batch_size=10000, **options):
+    """Stream `fields` of Merged once through an ApproximateOverview; memory is bounded by the sketch sizes."""
+    overview = ApproximateOverview(fields, numeric_fields, **options)
+    for frame in iter_merged_frames(db, fields, batch_size=batch_size):
+        overview.add(frame)
+    return overview
@@ -0,0 +1,210 @@
+import numpy as np
+from datetime import datetime, timezone
+from faker import Faker
+
+from Id_Lists import pack_ids
+
+
+# List of promotional keywords
+PROMO_KEYWORDS = ["ad", "sponsored", "promotion", "discount", "sale", "deal", "offer"]
+
+# Upper bounds used by the original per-row generator
+MAX_HASHTAGS = 5
+MAX_MENTIONS = 5
+MAX_PROMO = 5
+MAX_FOLLOW = 50
+
+# Timestamp part of the generated ObjectIds; fixed so that the same seed always gives the same ids
+OBJECT_ID_EPOCH = int(datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp())
+
+
+class DataGenerator:
+    """Batch generator for synthetic Users, Posts, Comments and Notifications.
+
+    Faker is only used to build small vocabulary pools once; every column is
+    then produced with NumPy by sampling those pools, so the cost per row is a
+    few vectorized operations instead of several Faker calls. Each collection
+    is yielded in chunks of ``chunk_size`` rows as a dict of columns.
+
+    With ``compact_ids`` the following/followers/liked id lists are stored as
+    packed 12-byte ObjectIds in one binary value per row instead of lists of
+    hex strings. Either way their lengths are stored as count fields.
+
+    Dates are datetime64 columns, which ingestion stores as BSON datetimes;
+    unverified emails have a null ``email_verified``.
+    """
+
+    def __init__(self, n_users=10000, n_posts=10000, n_comments=50000, n_notifications=2000,
+                 seed=None, chunk_size=10000, pool_size=1000, now=None, compact_ids=False):
+        self.n_users = n_users
+        self.n_posts = n_posts
+        self.n_comments = n_comments
+        self.n_notifications = n_notifications
+        self.chunk_size = chunk_size
+        self.compact_ids = compact_ids
+        self.rng = np.random.default_rng(seed)
+        self.now = np.datetime64(now or datetime.now(), 'us')
+
+        fake = Faker()
+        fake.seed_instance(seed)
+        self._build_pools(fake, pool_size)
+
+        # Ids are kept as raw 12-byte ObjectIds so posts and comments can reference them cheaply
+        self._user_oids = self._object_ids(n_users)
+        self._post_oids = self._object_ids(n_posts)
+
+        # Define misleading users (e.g., 10% of users)
+        self._misleading = np.zeros(n_users, dtype=bool)
+        self._misleading[self.rng.choice(n_users, int(0.1 * n_users), replace=False)] = True
+
+    def _build_pools(self, fake, pool_size):
+        # Tokens appended to post bodies carry their leading space so rows can be concatenated directly
+        self.hashtags = np.array([' #' + fake.word() for _ in range(pool_size)], dtype=object)
+        self.mentions = np.array([' @' + fake.user_name() for _ in range(pool_size)], dtype=object)
+        self.promo = np.array([' ' + k for k in PROMO_KEYWORDS], dtype=object)
+        self.sentences = np.array([fake.sentence() for _ in range(pool_size)], dtype=object)
+        self.usernames = np.array([fake.user_name() for _ in range(pool_size)], dtype=object)
+        self.names = np.array([fake.name() for _ in range(pool_size)], dtype=object)
+        self.bios = np.array([fake.text(max_nb_chars=160) for _ in range(pool_size)], dtype=object)
+        self.emails = np.array([fake.email() for _ in range(pool_size)], dtype=object)
+        self.image_urls = np.array([fake.image_url() for _ in range(pool_size)], dtype=object)
+
+    # Helpers
+
+    def _sample(self, pool, n):
+        return pool[self.rng.integers(0, len(pool), n)]
+
+    def _object_ids(self, n):
+        # 4-byte big-endian timestamp followed by 8 seeded random bytes, same layout as bson.ObjectId
+        raw = np.empty((n, 12), dtype=np.uint8)
+        raw[:, :4] = np.frombuffer(OBJECT_ID_EPOCH.to_bytes(4, 'big'), dtype=np.uint8)
+        raw[:, 4:] = self.rng.integers(0, 256, (n, 8), dtype=np.uint8)
+        return raw
+
+    @staticmethod
+    def _hex(raw):
+        return np.frombuffer(raw.tobytes().hex().encode('ascii'), dtype='S24').astype('U24')
+
+    def _id_lists(self, counts):
+        # Followed, following and liking users are drawn from the generated users, so the lists form a graph
+        raw = self._user_oids[self.rng.integers(0, self.n_users, int(counts.sum()))]
+        if self.compact_ids:
+            bounds = np.concatenate([[0], np.cumsum(counts)])
+            return [pack_ids(raw[a:b]) for a, b in zip(bounds[:-1], bounds[1:])]
+        ids = self._hex(raw)
+        return [part.tolist() for part in np.split(ids, np.cumsum(counts)[:-1])]
+
+    def _random_times(self, start, n):
+        # Uniformly distributed timestamps between start (scalar or array) and now
+        span = (self.now - start).astype(np.int64)
+        offsets = (self.rng.random(n) * span).astype(np.int64)
+        return start + offsets.astype('timedelta64[us]')
+
+    def _days_ago(self, days):
+        return self.now - np.timedelta64(days, 'D')
+
+    def _chunks(self, total):
+        for start in range(0, total, self.chunk_size):
+            yield start, min(start + self.chunk_size, total)
+
+    # Collections
+
+    def iter_users(self):
+        for start, stop in self._chunks(self.n_users):
+            n = stop - start
+            created_at = self._random_times(self._days_ago(365 * 5), n)
+            email_verified = self._random_times(self._days_ago(365), n)
+            num_following = self.rng.integers(0, MAX_FOLLOW + 1, n)
+            num_followers = self.rng.integers(0, MAX_FOLLOW + 1, n)
+            yield {
+                'user_id': self._hex(self._user_oids[start:stop]),
+                'name': self._sample(self.names, n),
+                'username': self._sample(self.usernames, n),
+                'bio': self._sample(self.bios, n),
+                'email': self._sample(self.emails, n),
+                # Unverified emails are stored as null dates
+                'email_verified': np.where(self.rng.random(n) > 0.5, email_verified.astype(object), None),
+                'image': self._sample(self.image_urls, n),
+                'cover_image': self._sample(self.image_urls, n),
+                'profile_image': self._sample(self.image_urls, n),
+                'hashed_password': np.frombuffer(self.rng.bytes(32 * n).hex().encode('ascii'), dtype='S64').astype('U64'),
+                'created_at': created_at,
+                'updated_at': self._random_times(created_at, n),
+                'following_ids': self._id_lists(num_following),
+                'followers_ids': self._id_lists(num_followers),
+                'num_following': num_following,
+                'num_followers': num_followers,
+                'has_notifications': self.rng.random(n) < 0.5,
+            }
+
+    def _post_bodies(self, n, is_misleading):
+        n_promo = np.where(is_misleading, self.rng.integers(2, 6, n), self.rng.integers(0, 4, n))
+        columns = [self._sample(self.sentences, n)[:, None]]
+        for pool, counts, width in ((self.hashtags, self.rng.integers(0, MAX_HASHTAGS + 1, n), MAX_HASHTAGS),
+                                    (self.mentions, self.rng.integers(0, MAX_MENTIONS + 1, n), MAX_MENTIONS),
+                                    (self.promo, n_promo, MAX_PROMO)):
+            picks = pool[self.rng.integers(0, len(pool), (n, width))]
+            picks[np.arange(width) >= counts[:, None]] = ''
+            columns.append(picks)
+        bodies = np.concatenate(columns, axis=1).sum(axis=1)
+
+        # 70% chance to not include clear advertising hashtags
+        for i in np.flatnonzero(is_misleading & (self.rng.random(n) > 0.7)):
+            bodies[i] = bodies[i].replace("#ad", "").replace("#sponsored", "")
+        return bodies
+
+    def iter_posts(self):
+        for start, stop in self._chunks(self.n_posts):
+            n = stop - start
+            author = self.rng.integers(0, self.n_users, n)
+
+            # If the post is by a misleading user, increase the chance of it being misleading
+            is_misleading = self._misleading[author] & (self.rng.random(n) > 0.5)
+
+            created_at = self._random_times(self._days_ago(365), n)
+            num_likes = self.rng.integers(0, self.n_users // 10 + 1, n)
+            yield {
+                'post_id': self._hex(self._post_oids[start:stop]),
+                'body': self._post_bodies(n, is_misleading),
+                'user_id': self._hex(self._user_oids[author]),
+                'created_at': created_at,
+                'updated_at': self._random_times(created_at, n),
+                'liked_ids': self._id_lists(num_likes),
+                'num_likes': num_likes,
+                'image': np.where(self.rng.random(n) > 0.5, self._sample(self.image_urls, n), None),
+                'label': is_misleading.astype(np.int64),
+            }
+
+    def iter_comments(self):
+        comment_oids = self._object_ids(self.n_comments)
+        for start, stop in self._chunks(self.n_comments):
+            n = stop - start
+            created_at = self._random_times(self._days_ago(365), n)
+            yield {
+                'comment_id': self._hex(comment_oids[start:stop]),
+                'body': self._sample(self.sentences, n),
+                'user_id': self._hex(self._user_oids[self.rng.integers(0, self.n_users, n)]),
+                'post_id': self._hex(self._post_oids[self.rng.integers(0, self.n_posts, n)]),
+                'created_at': created_at,
+                'updated_at': self._random_times(created_at, n),
+            }
+
+    def iter_notifications(self):
+        notification_oids = self._object_ids(self.n_notifications)
+        for start, stop in self._chunks(self.n_notifications):
+            n = stop - start
+            yield {
+                'notification_id': self._hex(notification_oids[start:stop]),
+                'body': self._sample(self.sentences, n),
+                'user_id': self._hex(self._user_oids[self.rng.integers(0, self.n_users, n)]),
+                'created_at': self._random_times(self._days_ago(365), n),
+            }
+
+    def iter_collection(self, name):
+        """Yield the chunks of one collection ('Users', 'Posts', 'Comments' or 'Notifications')."""
+        return {
+            'Users': self.iter_users,
+            'Posts': self.iter_posts,
+            'Comments': self.iter_comments,
+            'Notifications': self.iter_notifications,
+        }[name]()
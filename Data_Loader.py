@@ -0,0 +1,172 @@
+from collections import defaultdict
+from datetime import datetime
+
+import pandas as pd
+
+import Schema
+from Id_Lists import id_count
+
+
+# Related documents of a user: embedded arrays of Merged, or MergedBuckets documents in the bucketed layout
+CHILD_FIELDS = ['posts', 'comments', 'notifications']
+
+
+def _stored(field, fallback):
+    # Aggregate precomputed by the merge, computed from the embedded arrays for users merged without it
+    return {'$ifNull': [f'${field}', fallback]}
+
+
+# Per-user columns read from the aggregates stored in the Merged summaries, or computed inside
+# MongoDB so the nested posts/comments/notifications arrays never leave the server
+DERIVED_FIELDS = {
+    'num_posts': _stored('num_posts', {'$size': {'$ifNull': ['$posts', []]}}),
+    'num_comments': _stored('num_comments', {'$size': {'$ifNull': ['$comments', []]}}),
+    'num_notifications': _stored('num_notifications', {'$size': {'$ifNull': ['$notifications', []]}}),
+    # Id lists may be packed into binary values; their stored counts are used when present
+    'num_following': {'$ifNull': ['$num_following', {'$cond': [{'$isArray': '$following_ids'},
+                                                                {'$size': '$following_ids'}, 0]}]},
+    'num_followers': {'$ifNull': ['$num_followers', {'$cond': [{'$isArray': '$followers_ids'},
+                                                                {'$size': '$followers_ids'}, 0]}]},
+    # The label and content of a user are taken from their first post
+    'label': _stored('label', {'$arrayElemAt': ['$posts.label', 0]}),
+    'post_content': _stored('post_content', {'$arrayElemAt': ['$posts.body', 0]}),
+}
+
+# Python equivalents of DERIVED_FIELDS, for documents that are already in memory (e.g. scoring requests)
+def _first_post(document, key):
+    posts = document.get('posts') or []
+    return posts[0].get(key) if posts else None
+
+
+DOCUMENT_FIELDS = {
+    'num_posts': lambda d: d['num_posts'] if 'num_posts' in d else len(d.get('posts') or []),
+    'num_comments': lambda d: d['num_comments'] if 'num_comments' in d else len(d.get('comments') or []),
+    'num_notifications': lambda d: (d['num_notifications'] if 'num_notifications' in d
+                                    else len(d.get('notifications') or [])),
+    'num_following': lambda d: d['num_following'] if 'num_following' in d else id_count(d.get('following_ids')),
+    'num_followers': lambda d: d['num_followers'] if 'num_followers' in d else id_count(d.get('followers_ids')),
+    'label': lambda d: d['label'] if 'label' in d else _first_post(d, 'label'),
+    'post_content': lambda d: d['post_content'] if 'post_content' in d else _first_post(d, 'body'),
+}
+
+
+def _month(created_at):
+    # created_at is a BSON datetime; Merged written before dates were native holds 'YYYY-MM-DD HH:MM:SS' strings
+    if isinstance(created_at, datetime):
+        return created_at.month
+    if isinstance(created_at, str) and created_at[5:7].isdigit():
+        return int(created_at[5:7])
+    return None
+
+
+# Per-user columns computed on the client from another loaded column: field -> (source field, function)
+CLIENT_FIELDS = {
+    'post_length': ('post_content', lambda text: len(text) if isinstance(text, str) else 0),
+    'month': ('created_at', _month),
+}
+
+
+def merged_pipeline(fields, query=None):
+    """Aggregation pipeline returning only `fields` of Merged, derived fields computed server-side."""
+    projection = {'_id': 0}
+    for field in fields:
+        if field in CLIENT_FIELDS:
+            field = CLIENT_FIELDS[field][0]
+        projection[field] = DERIVED_FIELDS.get(field, f'${field}')
+    pipeline = [{'$match': query}] if query else []
+    pipeline.append({'$project': projection})
+    return pipeline
+
+
+class ColumnBuilder:
+    """Accumulates documents batch by batch into one array per field, typed by Schema.MERGED_SCHEMA."""
+
+    def __init__(self, fields):
+        self.fields = list(fields)
+        self.chunks = {field: [] for field in self.fields}
+
+    def append(self, documents):
+        for field in self.fields:
+            if field in CLIENT_FIELDS:
+                source, func = CLIENT_FIELDS[field]
+                values = [func(document.get(source)) for document in documents]
+            else:
+                values = [document.get(field) for document in documents]
+            self.chunks[field].append(Schema.column(values, field))
+
+    def to_frame(self):
+        return pd.DataFrame({field: Schema.concat(chunks, field) for field, chunks in self.chunks.items()})
+
+
+def attach_children(db, documents, fields):
+    """Fill the requested child arrays (CHILD_FIELDS) of Merged summaries from their MergedBuckets.
+
+    Documents that still embed the arrays are left as they are; children come out in bucket order
+    (month, then insertion order).
+    """
+    wanted = [field for field in fields if field in CHILD_FIELDS]
+    user_ids = [document['user_id'] for document in documents if any(field not in document for field in wanted)]
+    if not user_ids:
+        return documents
+    children = defaultdict(list)
+    cursor = db['MergedBuckets'].find({'user_id': {'$in': user_ids}, 'field': {'$in': wanted}},
+                                      {'_id': 0, 'user_id': 1, 'field': 1, 'items': 1})
+    for bucket in cursor.sort([('user_id', 1), ('field', 1), ('period', 1), ('seq', 1)]):
+        children[bucket['user_id'], bucket['field']].extend(bucket['items'])
+    for document in documents:
+        for field in wanted:
+            if field not in document:
+                document[field] = children.get((document['user_id'], field), [])
+    return documents
+
+
+def _pipeline_fields(fields):
+    # Child arrays are looked up by user_id
+    if any(field in CHILD_FIELDS for field in fields) and 'user_id' not in fields:
+        return list(fields) + ['user_id']
+    return fields
+
+
+def iter_cursor_batches(cursor, batch_size):
+    batch = []
+    for document in cursor:
+        batch.append(document)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def frame_from_documents(documents, fields):
+    """Same table as load_merged, built from Merged-shaped documents held in memory."""
+    needed = {CLIENT_FIELDS[field][0] if field in CLIENT_FIELDS else field for field in fields}
+    rows = [{field: DOCUMENT_FIELDS[field](document) if field in DOCUMENT_FIELDS else document.get(field)
+             for field in needed} for document in documents]
+    builder = ColumnBuilder(fields)
+    builder.append(rows)
+    return builder.to_frame()
+
+
+def iter_merged_frames(db, fields, query=None, batch_size=10000):
+    """Stream the requested fields of Merged as one DataFrame per batch; memory is bounded by batch_size."""
+    cursor = db['Merged'].aggregate(merged_pipeline(_pipeline_fields(fields), query), batchSize=batch_size)
+    for batch in iter_cursor_batches(cursor, batch_size):
+        builder = ColumnBuilder(fields)
+        builder.append(attach_children(db, batch, fields))
+        yield builder.to_frame()
+
+
+def load_merged(db, fields, query=None, batch_size=10000):
+    """Load the requested per-user fields of the Merged collection into a DataFrame.
+
+    `fields` may mix stored fields (e.g. 'bio', 'has_notifications') and the derived
+    fields in DERIVED_FIELDS and CLIENT_FIELDS (e.g. 'num_posts', 'label', 'post_length').
+    Only the per-user summaries are read unless child arrays ('posts', 'comments', 'notifications')
+    are requested.
+    """
+    cursor = db['Merged'].aggregate(merged_pipeline(_pipeline_fields(fields), query), batchSize=batch_size)
+    builder = ColumnBuilder(fields)
+    for batch in iter_cursor_batches(cursor, batch_size):
+        builder.append(attach_children(db, batch, fields))
+    return builder.to_frame()
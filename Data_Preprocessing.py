@@ -1,38 +1,50 @@
+import argparse
+import itertools
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from operator import itemgetter
+import bson
 import pymongo
-from pymongo import MongoClient
-import nltk
-import string
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
-
-# Download the required datasets
-nltk.download('stopwords')
-nltk.download('punkt')
-
-# Connect to MongoDB
-client = MongoClient('mongodb://localhost:27017/')
-db = client['Tweet']
-
-# Get the collections
-posts = db['Posts']
-comments = db['Comments']
-users = db['Users']
-notifications = db['Notifications']
-
-# Create a new collection for the merged data
-merged = db['Merged']
-
-# Create a unique index on user_id to prevent duplicates
-merged.create_index("user_id", unique=True)
-
-# Define a function to clean text
-def clean_text(text):
-    if text is None:
-        return ""
-    stop_words = set(stopwords.words('english'))
-    word_tokens = word_tokenize(text.lower())  # Convert to lowercase
-    filtered_text = [w for w in word_tokens if w not in stop_words and w not in string.punctuation]  # Remove punctuation
-    return " ".join(filtered_text)
+from pymongo import MongoClient, UpdateOne
+import Instrumentation
+import Schema
+import Text_Cleaning
+from Id_Lists import ID_LIST_FIELDS, compact_id_lists
+from Instrumentation import stage
+from Text_Cleaning import clean_text
+
+MONGO_URI = 'mongodb://localhost:27017/'
+DB_NAME = 'Tweet'
+
+# Collections that are embedded into each user document
+RELATED_COLLECTIONS = [('Posts', 'posts'), ('Comments', 'comments'), ('Notifications', 'notifications')]
+
+# Collections whose new documents can change a merged user
+SOURCE_COLLECTIONS = ['Users'] + [collection_name for collection_name, _ in RELATED_COLLECTIONS]
+
+# Number of user ids per $in query in incremental mode
+USER_ID_BATCH = 10000
+
+# Incremental runs re-scan this far below each watermark: ObjectIds are generated by the client before
+# the insert commits, so concurrent inserts (the Ingestion thread pool, other processes) can commit
+# below a watermark after it was taken; re-merging a user is idempotent
+WATERMARK_SAFETY = timedelta(minutes=10)
+
+# Pack list-valued following/followers/liked ids into binary ObjectIds while merging (--compact-ids);
+# their counts are stored either way
+COMPACT_IDS = False
+
+# Bucketed layout: Merged holds one bounded summary document per user (profile plus precomputed counts,
+# first/latest post fields; id lists only as counts) and the posts, comments and notifications go to
+# MergedBuckets, grouped by month and capped at BUCKET_ITEMS documents or BUCKET_BYTES of BSON per bucket,
+# well below MongoDB's 16 MB document limit. --embedded keeps them inside the user document instead.
+BUCKETED = True
+BUCKET_ITEMS = 500
+BUCKET_BYTES = 4 * 2**20
+
+# Fields of a merged user document holding embedded related documents
+CHILD_FIELDS = [field_name for _, field_name in RELATED_COLLECTIONS]
 
 # Define a function to merge specific collections into a user document
 def merge_into_user(user_document, collection, field_name):
@@ -47,23 +59,333 @@ def clean_document(document):
         document['bio'] = clean_text(document['bio'])
     if 'notification_type' in document:
         document['notification_type'] = clean_text(document['notification_type'])
+    compact_id_lists(document, pack=COMPACT_IDS)
+    # Legacy string dates are written to Merged as BSON datetimes
+    Schema.coerce_document(document)
     document.pop('_id', None)
     return document
 
-# Iterate over the user documents
-for user_document in users.find():
-    user_document = clean_document(user_document)
+# Create the indexes the merge relies on
+def ensure_indexes(db):
+    db['Users'].create_index([("user_id", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)])
+    for collection_name, _ in RELATED_COLLECTIONS:
+        db[collection_name].create_index([("user_id", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)])
+
+    # Create a unique index on user_id to prevent duplicates
+    db['Merged'].create_index("user_id", unique=True)
+    db['MergedBuckets'].create_index([("user_id", pymongo.ASCENDING), ("field", pymongo.ASCENDING),
+                                      ("period", pymongo.ASCENDING), ("seq", pymongo.ASCENDING)], unique=True)
+
+# Precomputed per-user aggregates, so loaders never need the embedded or bucketed documents
+def add_aggregates(user_document):
+    posts = user_document.get("posts") or []
+    for field_name in CHILD_FIELDS:
+        user_document[f"num_{field_name}"] = len(user_document.get(field_name) or [])
+    # Posts are in insertion order: the first one gives the label and content used for training
+    user_document["label"] = posts[0].get("label") if posts else None
+    user_document["post_content"] = posts[0].get("body") if posts else None
+    # The latest post is the one created last, whatever order the posts were inserted in
+    dated = [post for post in posts if isinstance(post.get("created_at"), datetime)]
+    latest = max(dated, key=itemgetter("created_at")) if dated else None
+    user_document["latest_post_label"] = latest.get("label") if latest else None
+    user_document["latest_post_at"] = latest["created_at"] if latest else None
+    return user_document
+
+# Split documents into consecutive chunks of at most BUCKET_ITEMS documents and BUCKET_BYTES of BSON
+# (a single larger document gets a chunk of its own)
+def split_by_size(documents):
+    chunk, size = [], 0
+    for document in documents:
+        document_size = len(bson.encode(document))
+        if chunk and (len(chunk) == BUCKET_ITEMS or size + document_size > BUCKET_BYTES):
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(document)
+        size += document_size
+    if chunk:
+        yield chunk
+
+# Split the related documents of one field into bucket documents: by month of created_at, then by
+# split_by_size, so no document grows with the activity of a user
+def make_buckets(user_id, field_name, documents, write_id):
+    periods = {}
+    for document in documents:
+        # Id lists (e.g. the likes of a post) are stored packed, 12 bytes per id
+        compact_id_lists(document, pack=True)
+        created_at = document.get("created_at")
+        period = datetime(created_at.year, created_at.month, 1) if isinstance(created_at, datetime) else None
+        periods.setdefault(period, []).append(document)
+    for period, items in periods.items():
+        for seq, chunk in enumerate(split_by_size(items)):
+            yield {"user_id": user_id, "field": field_name, "period": period, "seq": seq,
+                   "count": len(chunk), "items": chunk, "write_id": write_id}
+
+# Original merge: five round trips per user
+def merge_per_user(db):
+    users = db['Users']
+    merged = db['Merged']
+
+    # Iterate over the user documents
+    for user_document in users.find():
+        user_document = clean_document(user_document)
+        user_document["merged_at"] = datetime.now(timezone.utc)
+
+        # Merge related documents from other collections into the user document
+        for collection_name, field_name in RELATED_COLLECTIONS:
+            merge_into_user(user_document, db[collection_name], field_name)
+        # This mode always keeps the related documents embedded
+        add_aggregates(user_document)
+
+        # Check if the user document already exists in the merged collection
+        existing_document = merged.find_one({"user_id": user_document["user_id"]})
+        if existing_document:
+            # Update the existing document
+            merged.update_one({"user_id": user_document["user_id"]}, {"$set": user_document})
+        else:
+            # Insert the merged user document into the merged collection
+            merged.insert_one(user_document)
+        # Buckets of an earlier bucketed merge would shadow the embedded documents
+        db['MergedBuckets'].delete_many({"user_id": user_document["user_id"]})
+    bump_merged_version(db)
+
+# Group a cursor sorted on user_id into (user_id, [documents]) pairs
+def group_by_user(cursor):
+    for user_id, documents in itertools.groupby(cursor, key=itemgetter("user_id")):
+        yield user_id, [clean_document(doc) for doc in documents]
+
+# Build the merged documents from one sorted cursor per collection
+def iter_merged_documents(db, query=None):
+    query = query or {}
+    sort = [("user_id", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)]
+    related = [(field_name, group_by_user(db[collection_name].find(query).sort(sort)))
+               for collection_name, field_name in RELATED_COLLECTIONS]
+    heads = [next(groups, None) for _, groups in related]
+
+    for user_document in db['Users'].find(query).sort(sort):
+        user_document = clean_document(user_document)
+        user_id = user_document["user_id"]
+        for i, (field_name, groups) in enumerate(related):
+            # Skip documents that belong to users that are not in the Users collection
+            while heads[i] is not None and heads[i][0] < user_id:
+                heads[i] = next(groups, None)
+            if heads[i] is not None and heads[i][0] == user_id:
+                user_document[field_name] = heads[i][1]
+                heads[i] = next(groups, None)
+            else:
+                user_document[field_name] = []
+        yield user_document
+
+# Write one batch of summaries and their buckets, then drop the buckets of these users left over
+# from earlier writes (e.g. a month that now has fewer documents, or every bucket with --embedded)
+def flush_merged(db, batch, bucket_batch, user_ids, write_id):
+    db['Merged'].bulk_write(batch, ordered=False)
+    if bucket_batch:
+        db['MergedBuckets'].bulk_write(bucket_batch, ordered=False)
+    db['MergedBuckets'].delete_many({"user_id": {"$in": user_ids}, "write_id": {"$ne": write_id}})
+    return len(batch)
+
+# Upsert merged documents into the merged collection with unordered bulk writes
+def write_merged(db, documents, batch_size=1000):
+    written = 0
+    batch, bucket_batch, user_ids = [], [], []
+    write_id = bson.ObjectId()
+    with stage('merge') as metrics:
+        for document in documents:
+            # merged_at lets downstream consumers (e.g. incremental model updates) pick up changed users
+            document["merged_at"] = datetime.now(timezone.utc)
+            add_aggregates(document)
+            update = {"$set": document}
+            if BUCKETED:
+                for field_name in CHILD_FIELDS:
+                    for bucket in make_buckets(document["user_id"], field_name, document.pop(field_name, []), write_id):
+                        bucket_batch.append(UpdateOne({key: bucket[key] for key in ("user_id", "field", "period", "seq")},
+                                                      {"$set": bucket}, upsert=True))
+                # The summary keeps only the counts of the id lists (added by compact_id_lists)
+                for field_name in ID_LIST_FIELDS:
+                    document.pop(field_name, None)
+                # Users merged with the embedded layout before lose their arrays
+                update["$unset"] = {field_name: "" for field_name in CHILD_FIELDS + list(ID_LIST_FIELDS)}
+            batch.append(UpdateOne({"user_id": document["user_id"]}, update, upsert=True))
+            user_ids.append(document["user_id"])
+            if len(batch) == batch_size:
+                written += flush_merged(db, batch, bucket_batch, user_ids, write_id)
+                batch, bucket_batch, user_ids = [], [], []
+        if batch:
+            written += flush_merged(db, batch, bucket_batch, user_ids, write_id)
+        metrics.rows = written
+    if written:
+        bump_merged_version(db)
+    return written
 
-    # Merge related documents from other collections into the user document
-    merge_into_user(user_document, posts, 'posts')
-    merge_into_user(user_document, comments, 'comments')
-    merge_into_user(user_document, notifications, 'notifications')
+# Record that Merged changed; readers such as the feature snapshot key their caches on this version
+def bump_merged_version(db):
+    db['Watermarks'].update_one({"_id": "Merged"},
+                                {"$set": {"version": bson.ObjectId(), "updated_at": datetime.now(timezone.utc)}},
+                                upsert=True)
 
-    # Check if the user document already exists in the merged collection
-    existing_document = merged.find_one({"user_id": user_document["user_id"]})
-    if existing_document:
-        # Update the existing document
-        merged.update_one({"user_id": user_document["user_id"]}, {"$set": user_document})
+# Merge every user with a single sorted-cursor join per collection
+def merge_joined(db, batch_size=1000):
+    return write_merged(db, iter_merged_documents(db), batch_size)
+
+# Split Users into user_id ranges of roughly equal size, one query per shard
+def shard_queries(db, n_shards):
+    users = db['Users']
+    n_users = users.count_documents({})
+    bounds = []
+    for shard in range(1, n_shards):
+        boundary = users.find_one({}, {"user_id": 1}, sort=[("user_id", pymongo.ASCENDING)],
+                                  skip=shard * n_users // n_shards)
+        if boundary and (not bounds or boundary["user_id"] > bounds[-1]):
+            bounds.append(boundary["user_id"])
+
+    queries = []
+    for low, high in zip([None] + bounds, bounds + [None]):
+        user_range = {}
+        if low is not None:
+            user_range["$gte"] = low
+        if high is not None:
+            user_range["$lt"] = high
+        queries.append({"user_id": user_range} if user_range else {})
+    return queries
+
+# Worker: clean and merge one shard with its own MongoClient
+def merge_shard(shard, query, batch_size, tokenizer, compact_ids=False, bucketed=True, mongo_uri=MONGO_URI,
+                db_name=DB_NAME):
+    global COMPACT_IDS, BUCKETED
+    Text_Cleaning.DEFAULT_TOKENIZER = tokenizer
+    COMPACT_IDS = compact_ids
+    BUCKETED = bucketed
+    start = time.perf_counter()
+    client = MongoClient(mongo_uri, maxPoolSize=4)
+    try:
+        written = write_merged(client[db_name], iter_merged_documents(client[db_name], query), batch_size)
+    finally:
+        client.close()
+    return shard, written, time.perf_counter() - start
+
+# Run the shard queries on a pool of worker processes
+def merge_sharded(queries, workers, batch_size=1000, mongo_uri=MONGO_URI, db_name=DB_NAME):
+    tokenizer = Text_Cleaning.DEFAULT_TOKENIZER
+    written = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(merge_shard, shard, query, batch_size, tokenizer, COMPACT_IDS, BUCKETED,
+                                   mongo_uri, db_name)
+                   for shard, query in enumerate(queries)]
+        for future in as_completed(futures):
+            shard, shard_written, elapsed = future.result()
+            written += shard_written
+            print(f"Shard {shard + 1}/{len(queries)}: merged {shard_written} users in {elapsed:.2f}s")
+    return written
+
+# Highest _id of a collection; ObjectIds grow with insertion time
+def latest_id(collection):
+    latest = collection.find_one({}, {"_id": 1}, sort=[("_id", pymongo.DESCENDING)])
+    return latest["_id"] if latest else None
+
+# Watermarks are stored per source collection as {_id: collection name, last_id, updated_at}
+def load_watermarks(db):
+    return {doc["_id"]: doc["last_id"] for doc in db['Watermarks'].find({"_id": {"$in": SOURCE_COLLECTIONS}})}
+
+def save_watermarks(db, watermarks):
+    now = datetime.now(timezone.utc)
+    for collection_name, last_id in watermarks.items():
+        if last_id is not None:
+            db['Watermarks'].update_one({"_id": collection_name},
+                                        {"$set": {"last_id": last_id, "updated_at": now}}, upsert=True)
+
+# Lowest _id re-scanned for a watermark: WATERMARK_SAFETY before the time encoded in it
+def rescan_from(last_id):
+    if not isinstance(last_id, bson.ObjectId):
+        return last_id
+    return bson.ObjectId.from_datetime(last_id.generation_time - WATERMARK_SAFETY)
+
+# User ids with documents inserted up to the new watermark since WATERMARK_SAFETY before the old one
+def touched_user_ids(db, old_watermarks, new_watermarks):
+    user_ids = set()
+    for collection_name in SOURCE_COLLECTIONS:
+        high = new_watermarks.get(collection_name)
+        if high is None:
+            continue
+        id_range = {"$lte": high}
+        if old_watermarks.get(collection_name) is not None:
+            id_range["$gte"] = rescan_from(old_watermarks[collection_name])
+        pipeline = [{"$match": {"_id": id_range}}, {"$group": {"_id": "$user_id"}}]
+        user_ids.update(doc["_id"] for doc in db[collection_name].aggregate(pipeline))
+    return sorted(user_ids)
+
+# Re-merge only the users touched since the last run, then move the watermarks forward; workers
+# connect to mongo_uri and the database of `db`
+def merge_incremental(db, batch_size=1000, workers=1, mongo_uri=MONGO_URI):
+    old_watermarks = load_watermarks(db)
+
+    # Capture the high-watermarks before reading. Documents committed while we merge, or committed late
+    # with an older _id than a watermark, are picked up by the next run's re-scan window (WATERMARK_SAFETY);
+    # re-merging their users is harmless because upserts are idempotent
+    new_watermarks = {collection_name: latest_id(db[collection_name]) for collection_name in SOURCE_COLLECTIONS}
+
+    if not old_watermarks:
+        queries = shard_queries(db, workers) if workers > 1 else [{}]
+    else:
+        user_ids = touched_user_ids(db, old_watermarks, new_watermarks)
+        # At least one roughly equal batch per worker, each at most USER_ID_BATCH ids
+        n_batches = max(workers, -(-len(user_ids) // USER_ID_BATCH))
+        id_batch = max(1, -(-len(user_ids) // n_batches))
+        queries = [{"user_id": {"$in": user_ids[start:start + id_batch]}}
+                   for start in range(0, len(user_ids), id_batch)]
+
+    if workers > 1:
+        written = merge_sharded(queries, workers, batch_size, mongo_uri, db.name)
     else:
-        # Insert the merged user document into the merged collection
-        merged.insert_one(user_document)
+        written = sum(write_merged(db, iter_merged_documents(db, query), batch_size) for query in queries)
+
+    save_watermarks(db, new_watermarks)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge Users, Posts, Comments and Notifications into Merged.")
+    parser.add_argument("--mode", choices=["join", "incremental", "per-user"], default="join",
+                        help="join: sorted-cursor join with bulk upserts; incremental: only users with documents "
+                             "inserted since the last incremental run; per-user: one query per user and collection "
+                             "(always embedded)")
+    parser.add_argument("--batch-size", type=int, default=1000, help="number of upserts per bulk write")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of worker processes; Users are split into this many user_id ranges")
+    parser.add_argument("--tokenizer", choices=Text_Cleaning.TOKENIZERS, default=Text_Cleaning.DEFAULT_TOKENIZER,
+                        help="regex: fast tokenizer; nltk: word_tokenize, identical to the original output")
+    parser.add_argument("--compact-ids", action="store_true",
+                        help="store following/followers/liked ids in Merged as packed binary ObjectIds")
+    parser.add_argument("--embedded", action="store_true",
+                        help="embed posts, comments and notifications in the Merged documents instead of "
+                             "writing them to time-bucketed MergedBuckets documents")
+    Instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+    global COMPACT_IDS, BUCKETED
+    Text_Cleaning.DEFAULT_TOKENIZER = args.tokenizer
+    COMPACT_IDS = args.compact_ids
+    BUCKETED = not args.embedded
+    Instrumentation.configure_from_args(args)
+
+    # Connect to MongoDB
+    client = MongoClient(MONGO_URI)
+    db = client[DB_NAME]
+
+    ensure_indexes(db)
+    start = time.perf_counter()
+    with stage('preprocess'):
+        if args.mode == "join":
+            if args.workers > 1:
+                written = merge_sharded(shard_queries(db, args.workers), args.workers, args.batch_size)
+            else:
+                written = merge_joined(db, args.batch_size)
+            print(f"Merged {written} users in {time.perf_counter() - start:.2f}s.")
+        elif args.mode == "incremental":
+            written = merge_incremental(db, args.batch_size, args.workers)
+            print(f"Merged {written} users in {time.perf_counter() - start:.2f}s.")
+        else:
+            merge_per_user(db)
+    client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,193 +1,413 @@
-import tkinter as tk
-from tkinter import ttk
+import argparse
+import glob
+import html
+import io
+import json
+import os
+import re
+from collections import Counter
+from functools import lru_cache
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-from pymongo import MongoClient
-from wordcloud import WordCloud
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import numpy as np
+from pymongo import MongoClient
+import Instrumentation
+from Approximate_Stats import approximate_overview
+from Feature_Snapshot import SNAPSHOT_DIR, load_snapshot, snapshot_key
+from Instrumentation import stage
 
-# Connect to MongoDB
-client = MongoClient('mongodb://localhost:27017/')
-db = client['Tweet']
+# Columns of the Merged collection used by the analyses below
+EDA_FIELDS = ['user_id', 'email_verified', 'has_notifications', 'created_at', 'num_following',
+              'num_followers', 'num_posts', 'num_comments', 'label', 'post_content', 'post_length', 'month']
 
-# Load data from MongoDB into a DataFrame
-data = list(db['Merged'].find())
-df = pd.DataFrame(data)
+# Static HTML/PNG bundle written by the headless mode
+REPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'reports', 'eda')
 
-# Extract 'label' and 'post_content' from the nested 'posts' column
-df['label'] = df['posts'].apply(lambda x: x[0]['label'] if x else None)
-df['post_content'] = df['posts'].apply(lambda x: x[0]['body'] if x else None)
+# Bump when the layout of the cached aggregates changes
+AGGREGATES_FORMAT = 2
 
-# 1. Basic Overview
-def basic_overview():
-    print("Shape of the dataset:", df.shape)
-    print("\nData types and missing values:\n", df.info())
-    print("\nDescriptive statistics for numerical columns:\n", df.describe())
-    print("\nValue counts for 'label':\n", df['label'].value_counts())
+# Numeric columns summarized by the overview
+NUMERIC_FIELDS = ['num_following', 'num_followers', 'num_posts', 'num_comments', 'label', 'post_length', 'month']
 
-    # Handle nunique for columns with lists
-    for col in df.columns:
-        if df[col].apply(lambda x: isinstance(x, list)).any():
-            print(f"Number of unique lists in column {col}: {df[col].astype(str).nunique()}")
-        else:
-            print(f"Number of unique values in column {col}: {df[col].nunique()}")
+# Words kept per word cloud (WordCloud's own default max_words) and points kept for the scatter plot
+TOP_WORDS = 200
+SCATTER_SAMPLE = 5000
+
+# WordCloud's tokenizer, applied post by post instead of to one joined string
+WORD_PATTERN = re.compile(r"\w[\w']*")
+
+# matplotlib, seaborn and wordcloud are imported where they are used: rendering from cached
+# aggregates never needs wordcloud, and reading them never needs any plotting library
 
-    print("\nDate range for 'created_at':", df['created_at'].min(), "to", df['created_at'].max())
 
-    # Compute correlation matrix only for numeric columns
-    numeric_cols = df.select_dtypes(include=[np.number]).columns
-    print("\nCorrelation matrix:\n", df[numeric_cols].corr())
-    
-    # Compute skewness only for numeric columns
-    print("\nSkewness:\n", df[numeric_cols].skew())
-    print("\nKurtosis:\n", df[numeric_cols].kurt())
+@lru_cache(maxsize=1)
+def wordcloud_stopwords():
+    from wordcloud import STOPWORDS
 
-    # Assuming 'following_ids' and 'followers_ids' are lists of user IDs
-    df['num_following'] = df['following_ids'].apply(len)
-    df['num_followers'] = df['followers_ids'].apply(len)
-    df['num_posts'] = df['posts'].apply(len)
+    return frozenset(word.lower() for word in STOPWORDS)
 
-    plt.figure(figsize=(15, 5))
 
-    plt.subplot(1, 3, 1)
-    sns.histplot(df['num_following'], bins=30)
-    plt.title('Distribution of Number of Users Followed')
+def histogram(values, bins, weight=1.0):
+    counts, edges = np.histogram(np.asarray(values, dtype=np.float64), bins=bins)
+    return {'counts': (counts * weight).tolist(), 'edges': edges.tolist()}
 
-    plt.subplot(1, 3, 2)
-    sns.histplot(df['num_followers'], bins=30)
-    plt.title('Distribution of Number of Followers')
 
-    plt.subplot(1, 3, 3)
-    sns.histplot(df['num_posts'], bins=30)
-    plt.title('Distribution of Number of Posts per User')
+def word_frequencies(texts, top=TOP_WORDS):
+    """Most common words of the texts, tokenized and filtered like WordCloud.generate does."""
+    counts = Counter()
+    stopwords = wordcloud_stopwords()
+    for text in texts:
+        if not isinstance(text, str):
+            continue
+        for word in WORD_PATTERN.findall(text.lower()):
+            if word.endswith("'s"):
+                word = word[:-2]
+            if word and not word.isdigit() and word not in stopwords:
+                counts[word] += 1
+    return dict(counts.most_common(top))
 
 
+def _overview_text(df, numeric_cols):
+    out = io.StringIO()
+    info = io.StringIO()
+    df.info(buf=info)
+    print("Shape of the dataset:", df.shape, file=out)
+    print("\nData types and missing values:\n", info.getvalue(), file=out)
+    print("\nDescriptive statistics for numerical columns:\n", df.describe(), file=out)
+    print("\nValue counts for 'label':\n", df['label'].value_counts(), file=out)
+
+    # Handle nunique for columns with lists
+    for col in df.columns:
+        if df[col].apply(lambda x: isinstance(x, list)).any():
+            print(f"Number of unique lists in column {col}: {df[col].astype(str).nunique()}", file=out)
+        else:
+            print(f"Number of unique values in column {col}: {df[col].nunique()}", file=out)
+
+    print("\nDate range for 'created_at':", df['created_at'].min(), "to", df['created_at'].max(), file=out)
+    print("\nCorrelation matrix:\n", df[numeric_cols].corr(), file=out)
+    print("\nSkewness:\n", df[numeric_cols].skew(), file=out)
+    print("\nKurtosis:\n", df[numeric_cols].kurt(), file=out)
+    return out.getvalue()
+
+
+def _approximate_overview_text(overview):
+    out = io.StringIO()
+    print(f"Approximate overview: one pass over {overview.rows} users, sample of {len(overview.reservoir.rows)}",
+          file=out)
+    print("Shape of the dataset:", (overview.rows, len(overview.fields)), file=out)
+    print("\nMissing values:\n", pd.Series(overview.missing).reindex(overview.fields, fill_value=0), file=out)
+    print("\nDescriptive statistics for numerical columns (sketched quantiles):\n", overview.describe(), file=out)
+    print("\nValue counts for 'label':\n", pd.Series(overview.label_counts).sort_index(), file=out)
+    for col, count in overview.distinct_counts().items():
+        print(f"Approximate number of unique values in column {col}: {count}", file=out)
+    print("\nDate range for 'created_at':", overview.created_at[0], "to", overview.created_at[1], file=out)
+    print("\nCorrelation matrix:\n", overview.comoments.corr(), file=out)
+    print("\nSkewness:\n", overview.skew(), file=out)
+    print("\nKurtosis:\n", overview.kurt(), file=out)
+    return out.getvalue()
+
+
+def compute_aggregates(df, overview_text=None, weight=1.0):
+    """Everything the report plots, reduced to counts, bins and small samples (JSON-serializable).
+
+    When df is a sample, pass the overview computed over all users and weight = users / sample size
+    so that the plotted counts estimate the full counts.
+    """
+    from matplotlib import cbook
+
+    with stage('eda_aggregates', rows=len(df)):
+        # Compute statistics only for numeric columns
+        numeric_cols = df.select_dtypes(include=[np.number]).columns
+        following = df['num_following'].to_numpy()
+        followers = df['num_followers'].to_numpy()
+
+        sample = np.random.default_rng(0).permutation(len(df))[:SCATTER_SAMPLE]
+        box = cbook.boxplot_stats(following)[0]
+        # Duplicate outliers draw the same marker; keep each value once
+        box['fliers'] = np.unique(box['fliers'])
+        box = {key: value.tolist() if isinstance(value, np.ndarray) else float(value) for key, value in box.items()}
+
+        return {
+            'format': AGGREGATES_FORMAT,
+            'approximate': overview_text is not None,
+            'overview_text': overview_text or _overview_text(df, numeric_cols),
+            'histograms': {
+                'num_following': histogram(following, 30, weight),
+                'num_followers': histogram(followers, 30, weight),
+                'num_posts': histogram(df['num_posts'], 30, weight),
+                'post_length': histogram(df['post_length'], 50, weight),
+            },
+            'label_counts': {str(int(label)): int(round(count * weight))
+                             for label, count in df['label'].value_counts().sort_index().items()},
+            'month_counts': {str(int(month)): int(round(count * weight))
+                             for month, count in df['month'].dropna().value_counts().sort_index().items()},
+            'words': {
+                # Users without posts have a missing label, which matches neither
+                'misleading': word_frequencies(df.loc[df['label'].eq(1).fillna(False), 'post_content']),
+                'genuine': word_frequencies(df.loc[df['label'].eq(0).fillna(False), 'post_content']),
+            },
+            'follow_correlation': df[['num_following', 'num_followers']].corr().to_numpy().tolist(),
+            'follow_sample': [following[sample].tolist(), followers[sample].tolist()],
+            'following_box': box,
+            'missing_text': "Missing data for each column:\n" + df.isnull().sum().to_string(),
+        }
+
+
+def aggregates_path(key, cache_dir=SNAPSHOT_DIR, approximate=False):
+    return os.path.join(cache_dir, f"eda-{key}{'-approximate' if approximate else ''}.json")
+
+
+def load_aggregates(db, cache_dir=SNAPSHOT_DIR, refresh=False, approximate=False, **options):
+    """Aggregates of the current snapshot of Merged, computed once and cached next to the snapshot.
+
+    approximate=True streams Merged once in bounded memory instead of loading every user: the overview
+    comes from sketches and the plots from a reservoir sample. `options` (sample_size, distinct_error,
+    quantile_error) are passed to Approximate_Stats.ApproximateOverview; cached aggregates built with
+    other options are recomputed.
+    """
+    key = snapshot_key(db)
+    path = aggregates_path(key, cache_dir, approximate)
+    # The exact aggregates do not depend on the sketch options
+    options = {name: value for name, value in options.items() if value is not None} if approximate else {}
+    if not refresh and os.path.exists(path):
+        with open(path) as f:
+            aggregates = json.load(f)
+        if aggregates.get('format') == AGGREGATES_FORMAT and aggregates.get('options', {}) == options:
+            return aggregates
+
+    if approximate:
+        overview = approximate_overview(db, EDA_FIELDS, NUMERIC_FIELDS, **options)
+        sample = overview.sample()
+        aggregates = compute_aggregates(sample, _approximate_overview_text(overview),
+                                        overview.rows / max(len(sample), 1))
+    else:
+        # Load the per-user table from the local snapshot of Merged (rebuilt when Merged changes);
+        # counts, 'label' and 'post_content' (taken from the first post) are derived by the loader
+        aggregates = compute_aggregates(load_snapshot(db, EDA_FIELDS))
+    aggregates['options'] = options
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(aggregates, f)
+    os.replace(tmp_path, path)
+
+    # Aggregates of older snapshots are stale as soon as Merged changes
+    for stale in glob.glob(os.path.join(cache_dir, 'eda-*.json')):
+        if not os.path.basename(stale).startswith(f'eda-{key}'):
+            os.remove(stale)
+    return aggregates
+
+
+def plot_histogram(ax, hist, title):
+    edges = np.asarray(hist['edges'])
+    ax.bar(edges[:-1], hist['counts'], width=np.diff(edges), align='edge', edgecolor='white')
+    ax.set_title(title)
+    ax.set_ylabel('Count')
+
+
+def plot_word_cloud(ax, frequencies, title):
+    ax.axis('off')
+    ax.set_title(title)
+    if frequencies:
+        from wordcloud import WordCloud
+
+        wordcloud = WordCloud(width=800, height=400, background_color='white').generate_from_frequencies(frequencies)
+        ax.imshow(wordcloud, interpolation='bilinear')
+
+
+# Each tab draws on a blank figure from the cached aggregates and may return text to show alongside
+
+# 1. Basic Overview
+def basic_overview(aggregates, fig):
+    axes = fig.subplots(1, 3)
+    plot_histogram(axes[0], aggregates['histograms']['num_following'], 'Distribution of Number of Users Followed')
+    plot_histogram(axes[1], aggregates['histograms']['num_followers'], 'Distribution of Number of Followers')
+    plot_histogram(axes[2], aggregates['histograms']['num_posts'], 'Distribution of Number of Posts per User')
+    return aggregates['overview_text']
 
 # 2. Target Variable Analysis
-def target_variable_analysis():
-    if 'label' not in df.columns:
-        print("The 'label' column is not present in the dataset.")
-        return
-    plt.figure()
-    sns.countplot(data=df, x='label')
-    plt.title("Distribution of Labels (Misleading vs. Non-Misleading)")
+def target_variable_analysis(aggregates, fig):
+    import seaborn as sns
+
+    ax = fig.subplots()
+    counts = aggregates['label_counts']
+    sns.barplot(x=list(counts), y=list(counts.values()), ax=ax)
+    ax.set_xlabel('label')
+    ax.set_title("Distribution of Labels (Misleading vs. Non-Misleading)")
 
 # 3. Text Data Analysis
-def text_data_analysis():
-    if 'post_content' not in df.columns:
-        print("The 'post_content' column is not present in the dataset.")
-        return
+def text_data_analysis(aggregates, fig):
+    axes = fig.subplots(1, 3)
     # Length of posts
-    plt.figure()
-    df['post_length'] = df['post_content'].apply(lambda x: len(x) if isinstance(x, str) else 0)
-    sns.histplot(df['post_length'], bins=50)
-    plt.title('Distribution of Post Lengths')
-
-    # Word clouds for posts
-    misleading_posts = ' '.join(df[df['label'] == 1]['post_content'].dropna())
-    genuine_posts = ' '.join(df[df['label'] == 0]['post_content'].dropna())
-
-    plt.figure(figsize=(10, 7))
-    wordcloud_misleading = WordCloud(width=800, height=400, background_color='white').generate(misleading_posts)
-    plt.imshow(wordcloud_misleading, interpolation='bilinear')
-    plt.axis('off')
-    plt.title('Word Cloud for Misleading Posts')
-
-    plt.figure(figsize=(10, 7))
-    wordcloud_genuine = WordCloud(width=800, height=400, background_color='white').generate(genuine_posts)
-    plt.imshow(wordcloud_genuine, interpolation='bilinear')
-    plt.axis('off')
-    plt.title('Word Cloud for Genuine Posts')
+    plot_histogram(axes[0], aggregates['histograms']['post_length'], 'Distribution of Post Lengths')
+    # Word clouds for posts, from word counts rather than the joined posts
+    plot_word_cloud(axes[1], aggregates['words']['misleading'], 'Word Cloud for Misleading Posts')
+    plot_word_cloud(axes[2], aggregates['words']['genuine'], 'Word Cloud for Genuine Posts')
 
 # 4. Temporal Analysis
-def temporal_analysis():
-    df['created_at'] = pd.to_datetime(df['created_at'])
-    df['month'] = df['created_at'].dt.month
-    plt.figure()
-    sns.countplot(data=df, x='month')
-    plt.title('Posts Distribution by Month')
+def temporal_analysis(aggregates, fig):
+    import seaborn as sns
 
-# 5. User Behavior Analysis
-def user_behavior_analysis():
-    # Assuming 'following_ids' and 'followers_ids' are lists of user IDs
-    df['num_following'] = df['following_ids'].apply(len)
-    df['num_followers'] = df['followers_ids'].apply(len)
+    ax = fig.subplots()
+    counts = aggregates['month_counts']
+    sns.barplot(x=list(counts), y=list(counts.values()), ax=ax)
+    ax.set_xlabel('month')
+    ax.set_title('Posts Distribution by Month')
 
-    plt.figure(figsize=(12, 5))
-    plt.subplot(1, 2, 1)
-    sns.histplot(df['num_following'], bins=30)
-    plt.title('Distribution of Number of Users Followed')
-
-    plt.subplot(1, 2, 2)
-    sns.histplot(df['num_followers'], bins=30)
-    plt.title('Distribution of Number of Followers')
+# 5. User Behavior Analysis
+def user_behavior_analysis(aggregates, fig):
+    axes = fig.subplots(1, 2)
+    plot_histogram(axes[0], aggregates['histograms']['num_following'], 'Distribution of Number of Users Followed')
+    plot_histogram(axes[1], aggregates['histograms']['num_followers'], 'Distribution of Number of Followers')
 
 # 6. Correlation Analysis
-def correlation_analysis():
-    # Assuming 'num_following' and 'num_followers' are already created in user_behavior_analysis
-    correlation_matrix = df[['num_following', 'num_followers']].corr()
-    plt.figure()
-    sns.heatmap(correlation_matrix, annot=True, cmap='coolwarm')
-    plt.title('Correlation Analysis')
+def correlation_analysis(aggregates, fig):
+    import seaborn as sns
+
+    ax = fig.subplots()
+    labels = ['num_following', 'num_followers']
+    correlation_matrix = pd.DataFrame(aggregates['follow_correlation'], index=labels, columns=labels)
+    sns.heatmap(correlation_matrix, annot=True, cmap='coolwarm', ax=ax)
+    ax.set_title('Correlation Analysis')
 
 # 7. Multivariate Analysis
-def multivariate_analysis():
-    # Example: Scatter plot of 'num_following' vs 'num_followers'
-    plt.figure()
-    sns.scatterplot(data=df, x='num_following', y='num_followers')
-    plt.title('Scatter plot of Number of Users Followed vs Number of Followers')
+def multivariate_analysis(aggregates, fig):
+    # Scatter plot of 'num_following' vs 'num_followers' on a fixed random sample of users
+    import seaborn as sns
+
+    ax = fig.subplots()
+    sns.scatterplot(x=aggregates['follow_sample'][0], y=aggregates['follow_sample'][1], ax=ax)
+    ax.set_xlabel('num_following')
+    ax.set_ylabel('num_followers')
+    ax.set_title('Scatter plot of Number of Users Followed vs Number of Followers')
 
 # 8. Outliers Detection
-def outliers_detection():
-    # Example: Box plot for 'num_following'
-    plt.figure()
-    sns.boxplot(df['num_following'])
-    plt.title('Box plot for Number of Users Followed')
+def outliers_detection(aggregates, fig):
+    # Box plot for 'num_following' drawn from its precomputed quartiles, whiskers and outliers
+    ax = fig.subplots()
+    ax.bxp([aggregates['following_box']])
+    ax.set_title('Box plot for Number of Users Followed')
 
 # 9. Data Quality Issues
-def data_quality_issues():
-    # Example: Checking for missing values
-    missing_data = df.isnull().sum()
-    print("Missing data for each column:\n", missing_data)
+def data_quality_issues(aggregates, fig):
+    return aggregates['missing_text']
 
 # 10. Add other EDA functions here...
 
-def plot_to_tab(tab, plot_func):
-    """Utility function to plot directly to a tab."""
-    plot_func()
-    canvas = FigureCanvasTkAgg(plt.gcf(), master=tab)
-    canvas_widget = canvas.get_tk_widget()
-    canvas_widget.grid(row=0, column=0)
-    plt.close()
-
-# Create the main window
-root = tk.Tk()
-root.title("EDA Results")
-
-# Create the tab control
-tabControl = ttk.Notebook(root)
-
-# Create the tabs
-tabs = [
-    ("Basic Overview", basic_overview),
-    ("Target Variable Analysis", target_variable_analysis),
-    ("Text Data Analysis", text_data_analysis),
-    ("Temporal Analysis", temporal_analysis),
-    ("User Behavior Analysis", user_behavior_analysis),
-    ("Correlation Analysis", correlation_analysis),
-    ("Multivariate Analysis", multivariate_analysis),
-    ("Outliers Detection", outliers_detection),
-    ("Data Quality Issues", data_quality_issues)
-    # ... [Other EDA functions]
+TABS = [
+    ("Basic Overview", basic_overview, (15, 5)),
+    ("Target Variable Analysis", target_variable_analysis, (6.4, 4.8)),
+    ("Text Data Analysis", text_data_analysis, (18, 5)),
+    ("Temporal Analysis", temporal_analysis, (6.4, 4.8)),
+    ("User Behavior Analysis", user_behavior_analysis, (12, 5)),
+    ("Correlation Analysis", correlation_analysis, (6.4, 4.8)),
+    ("Multivariate Analysis", multivariate_analysis, (6.4, 4.8)),
+    ("Outliers Detection", outliers_detection, (6.4, 4.8)),
+    ("Data Quality Issues", data_quality_issues, (6.4, 4.8)),
 ]
 
-for tab_name, plot_func in tabs:
-    tab = ttk.Frame(tabControl)
-    tabControl.add(tab, text=tab_name)
-    plot_to_tab(tab, plot_func)
-
-tabControl.pack(expand=1, fill="both")
 
-root.mainloop()
+def render_tab(aggregates, plot_func, figsize):
+    """The tab's figure (None when it only has text) and its text."""
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=figsize)
+    text = plot_func(aggregates, fig)
+    if not fig.axes:
+        fig = None
+    else:
+        fig.tight_layout()
+    return fig, text
+
+
+def write_report(aggregates, output_dir=REPORT_DIR):
+    """Render every tab to PNG and link them from output_dir/index.html; no display needed."""
+    os.makedirs(output_dir, exist_ok=True)
+    sections = []
+    for number, (tab_name, plot_func, figsize) in enumerate(TABS, start=1):
+        fig, text = render_tab(aggregates, plot_func, figsize)
+        section = [f'<h2>{html.escape(tab_name)}</h2>']
+        if fig is not None:
+            image = f'{number:02d}.png'
+            fig.savefig(os.path.join(output_dir, image), dpi=100)
+            section.append(f'<img src="{image}" alt="{html.escape(tab_name)}">')
+        if text:
+            section.append(f'<pre>{html.escape(text)}</pre>')
+        sections.append('\n'.join(section))
+
+    path = os.path.join(output_dir, 'index.html')
+    with open(path, 'w') as f:
+        f.write('<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>EDA Results</title></head><body>\n'
+                '<h1>EDA Results</h1>\n' + '\n'.join(sections) + '\n</body></html>\n')
+    return path
+
+
+def show(aggregates):
+    """Tkinter window; a tab is only rendered the first time it is selected."""
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+    import tkinter as tk
+    from tkinter import ttk
+
+    # Create the main window
+    root = tk.Tk()
+    root.title("EDA Results")
+
+    # Create the tab control
+    tabControl = ttk.Notebook(root)
+    frames = []
+    for tab_name, _, _ in TABS:
+        tab = ttk.Frame(tabControl)
+        tabControl.add(tab, text=tab_name)
+        frames.append(tab)
+    rendered = set()
+
+    def on_tab_changed(event):
+        index = tabControl.index(tabControl.select())
+        if index in rendered:
+            return
+        rendered.add(index)
+        _, plot_func, figsize = TABS[index]
+        fig, text = render_tab(aggregates, plot_func, figsize)
+        if text:
+            print(text)
+        if fig is not None:
+            canvas = FigureCanvasTkAgg(fig, master=frames[index])
+            canvas.draw()
+            canvas.get_tk_widget().grid(row=0, column=0)
+
+    tabControl.bind('<<NotebookTabChanged>>', on_tab_changed)
+    tabControl.pack(expand=1, fill="both")
+    root.mainloop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exploratory analysis of the merged users.")
+    parser.add_argument("--headless", action="store_true",
+                        help="write a static HTML/PNG report instead of opening the window")
+    parser.add_argument("--output", default=REPORT_DIR, help="directory of the headless report")
+    parser.add_argument("--refresh", action="store_true", help="recompute the aggregates even if cached")
+    parser.add_argument("--approximate", action="store_true",
+                        help="one bounded-memory pass over Merged: sketched overview, plots from a sample")
+    parser.add_argument("--sample-size", type=int, default=10000, help="users kept in the reservoir sample")
+    parser.add_argument("--distinct-error", type=float, default=0.01,
+                        help="relative standard error of the distinct counts")
+    parser.add_argument("--quantile-error", type=float, default=0.01, help="approximate rank error of the quantiles")
+    Instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+    Instrumentation.configure_from_args(args)
+
+    # Connect to MongoDB
+    client = MongoClient('mongodb://localhost:27017/')
+    db = client['Tweet']
+    aggregates = load_aggregates(db, refresh=args.refresh, approximate=args.approximate,
+                                 sample_size=args.sample_size, distinct_error=args.distinct_error,
+                                 quantile_error=args.quantile_error)
+    client.close()
+
+    if args.headless:
+        print(f"Report written to {write_report(aggregates, args.output)}")
+    else:
+        show(aggregates)
+
+
+if __name__ == "__main__":
+    main()
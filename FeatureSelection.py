@@ -1,59 +1,264 @@
+import argparse
+import os
+import numpy as np
 import pandas as pd
 from pymongo import MongoClient
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler
-from sklearn.feature_selection import SelectKBest, chi2
-from sklearn.feature_extraction.text import TfidfVectorizer
-from textblob import TextBlob
-
-# Connect to MongoDB
-client = MongoClient('mongodb://localhost:27017/')
-db = client['Tweet']
-
-# Load data from MongoDB into a DataFrame
-data = list(db['Merged'].find())
-df = pd.DataFrame(data)
-
-# Perform feature selection
-selected_features = df[['email_verified', 'has_notifications', 'num_following', 'num_followers',
-                        'num_posts', 'post_length', 'month', 'post_content']]
-
-# Impute missing values in 'post_content'
-selected_features['post_content'].fillna('missing', inplace=True)
-
-# Extract sentiment score from 'bio' and 'post_content'
-selected_features['bio_sentiment'] = df['bio'].apply(lambda x: TextBlob(str(x)).sentiment.polarity)
-selected_features['post_sentiment'] = df['post_content'].apply(lambda x: TextBlob(str(x)).sentiment.polarity)
-
-# Vectorize 'post_content' using TF-IDF
-tfidf_vectorizer = TfidfVectorizer(max_features=1000)  # Adjust max_features as needed
-post_content_tfidf = tfidf_vectorizer.fit_transform(selected_features['post_content'])
-post_content_tfidf_df = pd.DataFrame(post_content_tfidf.toarray(),
-                                     columns=tfidf_vectorizer.get_feature_names_out())
-
-# Concatenate all selected features
-selected_features = pd.concat([selected_features, post_content_tfidf_df], axis=1)
-
-# Split data into train and test sets
-X_train, X_test = train_test_split(selected_features, test_size=0.2, random_state=42)
-
-# Scale numeric features
-scaler = StandardScaler()
-X_train_scaled = scaler.fit_transform(X_train.drop(columns=['post_content']))
-X_test_scaled = scaler.transform(X_test.drop(columns=['post_content']))
-
-# Select top K features using Chi-squared test
-num_features_to_select = 20  # Adjust the number of features to select
-selector = SelectKBest(score_func=chi2, k=num_features_to_select)
-X_train_selected = selector.fit_transform(X_train_scaled, X_train['label'])
-X_test_selected = selector.transform(X_test_scaled)
-
-# Create a new DataFrame for the selected features
-selected_features_df = pd.DataFrame(X_train_selected, columns=[f'selected_{i}' for i in range(num_features_to_select)])
-
-# Save the selected features to the MongoDB collection "Feature"
-selected_features_df['label'] = X_train['label'].values
-selected_features_df_dict = selected_features_df.to_dict(orient='records')
-db['Feature'].insert_many(selected_features_df_dict)
-
-print("Selected features have been saved to the 'Feature' collection.")
+import Instrumentation
+from Data_Loader import iter_merged_frames
+from Feature_Snapshot import load_snapshot, snapshot_key
+from Feature_Store import FeatureStore
+from Instrumentation import stage
+from Sentiment import SentimentScorer
+from Social_Graph import GRAPH_FEATURES, graph_features, join_graph_features
+from Training import is_test_user
+
+# Columns of the per-user table used to build the features
+FEATURE_FIELDS = ['user_id', 'email_verified', 'has_notifications', 'num_following', 'num_followers', 'num_posts',
+                  'post_length', 'month', 'post_content', 'bio', 'label', 'merged_at']
+
+# Numeric features placed in front of the TF-IDF columns
+NUMERIC_FEATURES = ['email_verified', 'has_notifications', 'num_following', 'num_followers', 'num_posts',
+                    'post_length', 'month', 'bio_sentiment', 'post_sentiment'] + GRAPH_FEATURES
+
+# Unbounded counts among the numeric features; the out-of-core mode log-scales them instead of fitting a scaler
+COUNT_FEATURES = ['num_following', 'num_followers', 'num_posts', 'post_length', 'follower_in_degree',
+                  'likes_received']
+
+# Hashed 'post_content' columns of the out-of-core mode
+HASH_FEATURES = 2 ** 18
+
+# Compact copy of the selected features, next to the scripts
+FEATURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'features')
+
+
+def sentiment(texts, scorer):
+    # Polarity in [-1, 1] shifted to [0, 1]; chi2 only accepts non-negative features
+    return (scorer.score(texts.tolist()) + 1) / 2
+
+
+def numeric_features(df, scorer):
+    # Extract sentiment score from 'bio' and 'post_content'
+    with stage('sentiment', rows=2 * len(df)):
+        bio_sentiment = sentiment(df['bio'], scorer)
+        post_sentiment = sentiment(df['post_content'], scorer)
+    return pd.DataFrame({
+        'email_verified': df['email_verified'].notna().astype(np.float32),
+        'has_notifications': df['has_notifications'].astype(np.float32),
+        'num_following': df['num_following'],
+        'num_followers': df['num_followers'],
+        'num_posts': df['num_posts'],
+        'post_length': df['post_length'],
+        'month': df['month'].fillna(0).astype(np.float32),
+        'bio_sentiment': bio_sentiment,
+        'post_sentiment': post_sentiment,
+        # Follower-network and like-graph features joined from Social_Graph
+        **{column: df[column] for column in GRAPH_FEATURES},
+    }, columns=NUMERIC_FEATURES)
+
+
+def build_feature_matrix(df, scorer, max_features=1000, tfidf_vectorizer=None):
+    """Sparse CSR matrix of the numeric features followed by the TF-IDF of 'post_content'.
+
+    Returns (features, feature_names, tfidf_vectorizer); a fitted `tfidf_vectorizer` is applied as it is,
+    otherwise a new one is fitted on `df`.
+    """
+    from scipy import sparse
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    # Vectorize 'post_content' using TF-IDF; the result stays sparse
+    with stage('tfidf', rows=len(df)):
+        if tfidf_vectorizer is None:
+            tfidf_vectorizer = TfidfVectorizer(max_features=max_features, dtype=np.float32)
+            post_content_tfidf = tfidf_vectorizer.fit_transform(df['post_content'])
+        else:
+            post_content_tfidf = tfidf_vectorizer.transform(df['post_content'])
+
+    numeric = sparse.csr_matrix(numeric_features(df, scorer).to_numpy(dtype=np.float32))
+    features = sparse.hstack([numeric, post_content_tfidf], format='csr')
+    # Words are prefixed so that they never clash with the numeric feature names (e.g. 'month')
+    feature_names = NUMERIC_FEATURES + [f'tfidf:{word}' for word in tfidf_vectorizer.get_feature_names_out()]
+    return features, feature_names, tfidf_vectorizer
+
+
+def prepare_frame(df, graph):
+    """Join the graph features and impute missing 'post_content', as the features are built from."""
+    df = join_graph_features(df, graph)
+    df['post_content'] = df['post_content'].fillna('missing')
+    return df
+
+
+def transform_selected(df, scorer, pipeline):
+    """Selected features of `df` (see prepare_frame) through a frozen pipeline; nothing is refitted."""
+    features, _, _ = build_feature_matrix(df, scorer, tfidf_vectorizer=pipeline['vectorizer'])
+    return pipeline['selector'].transform(pipeline['scaler'].transform(features))
+
+
+def hashing_vectorizer(n_features=HASH_FEATURES):
+    """Stateless stand-in for the fitted TF-IDF: every chunk is vectorized on its own."""
+    from sklearn.feature_extraction.text import HashingVectorizer
+
+    # Non-negative term frequencies (chi2 and MultinomialNB need them), l2-normalized per post like TF-IDF rows
+    return HashingVectorizer(n_features=n_features, alternate_sign=False, norm='l2', dtype=np.float32)
+
+
+def stream_feature_columns(n_features=HASH_FEATURES):
+    """Names of the out-of-core feature columns; the hashed text is one block of n_features columns."""
+    return NUMERIC_FEATURES + [f'post_content_hashed_{n_features}']
+
+
+def streaming_feature_matrix(df, scorer, vectorizer):
+    """Features of one chunk without any fitted state: scaled numeric features followed by the hashed text."""
+    from scipy import sparse
+
+    numeric = numeric_features(df, scorer)
+    numeric[COUNT_FEATURES] = np.log1p(numeric[COUNT_FEATURES].astype(np.float32))
+    numeric['month'] = numeric['month'] / 12
+    with stage('hashing', rows=len(df)):
+        post_content_hashed = vectorizer.transform(df['post_content'])
+    return sparse.hstack([sparse.csr_matrix(numeric.to_numpy(dtype=np.float32)), post_content_hashed], format='csr')
+
+
+def iter_feature_chunks(db, scorer, graph, n_features=HASH_FEATURES, chunk_size=10000, query=None):
+    """Stream the labelled users of Merged as (users, features) chunks; memory is bounded by chunk_size.
+
+    `users` holds the user_id, merged_at and label of each row of the CSR `features`;
+    `graph` is the per-user table returned by Social_Graph.graph_features.
+    """
+    vectorizer = hashing_vectorizer(n_features)
+    for df in iter_merged_frames(db, FEATURE_FIELDS, query, chunk_size):
+        # Users without posts have no label
+        df = df[df['label'].notnull()].reset_index(drop=True)
+        if not len(df):
+            continue
+        df = prepare_frame(df, graph)
+        yield df[['user_id', 'merged_at', 'label']], streaming_feature_matrix(df, scorer, vectorizer)
+
+
+def select_features(features, labels, num_features_to_select=20, is_test=None):
+    """Scale and select the top K features on a train split; every step accepts sparse input.
+
+    `is_test` marks the test rows (e.g. Training.is_test_user); a random 80/20 split is used without it.
+    """
+    from sklearn.model_selection import train_test_split
+    from sklearn.preprocessing import MaxAbsScaler
+    from sklearn.feature_selection import SelectKBest, chi2
+
+    if is_test is None:
+        X_train, X_test, y_train, y_test = train_test_split(features, labels, test_size=0.2, random_state=42)
+    else:
+        X_train, X_test, y_train, y_test = features[~is_test], features[is_test], labels[~is_test], labels[is_test]
+
+    # MaxAbsScaler keeps zeros at zero (and non-negative features non-negative)
+    scaler = MaxAbsScaler()
+    X_train_scaled = scaler.fit_transform(X_train)
+    X_test_scaled = scaler.transform(X_test)
+
+    # Select top K features using Chi-squared test
+    selector = SelectKBest(score_func=chi2, k=min(num_features_to_select, features.shape[1]))
+    with stage('select', rows=features.shape[0]):
+        X_train_selected = selector.fit_transform(X_train_scaled, y_train)
+        X_test_selected = selector.transform(X_test_scaled)
+    return X_train_selected, X_test_selected, y_train, y_test, scaler, selector
+
+
+def save_selected(path, X_selected, labels, feature_names):
+    """Store a CSR matrix with its labels and feature names in one compressed .npz file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    np.savez_compressed(path, data=X_selected.data, indices=X_selected.indices, indptr=X_selected.indptr,
+                        shape=X_selected.shape, label=np.asarray(labels), feature_names=np.asarray(feature_names))
+
+
+def load_selected(path):
+    from scipy import sparse
+
+    with np.load(path) as stored:
+        X_selected = sparse.csr_matrix((stored['data'], stored['indices'], stored['indptr']), shape=stored['shape'])
+        return X_selected, stored['label'], stored['feature_names'].tolist()
+
+
+def run(db, max_features=1000, num_features_to_select=20, processes=None, refit=False):
+    """Build, select and save the features of every labelled user; returns the selected feature names.
+
+    The vectorizer, scaler and selector are fitted once per feature set and stored with it; later runs
+    with the same parameters transform the new users through them, unless `refit` is set.
+    """
+    # Load the per-user table from the local snapshot of Merged (rebuilt when Merged changes);
+    # counts, 'post_length', 'month', 'label' and 'post_content' are derived by the loader
+    with stage('load') as metrics:
+        df = load_snapshot(db, FEATURE_FIELDS)
+        metrics.rows = len(df)
+
+    # Users without posts have no label
+    df = df[df['label'].notnull()].reset_index(drop=True)
+
+    # PageRank, reciprocity and like-ring density of each user (the graph is updated incrementally),
+    # and 'missing' for users without post content
+    df = prepare_frame(df, graph_features(db))
+
+    store = FeatureStore(db)
+    store.ensure_indexes()
+    parameters = {'max_features': max_features, 'k': num_features_to_select}
+    current = None if refit else store.feature_set()
+    if current is not None and any(current.get(key) != value for key, value in parameters.items()):
+        current = None
+    pipeline = store.pipeline(current)
+
+    # Sentiment scores are cached by content hash in the 'Sentiment' collection
+    scorer = SentimentScorer(cache=db['Sentiment'], processes=processes)
+    labels = df['label'].to_numpy(dtype=np.int64)
+    # Same train/test split as ML.py, so the selection never sees the users models are tested on
+    is_test = is_test_user(df['user_id'])
+    if pipeline is None:
+        features, feature_names, vectorizer = build_feature_matrix(df, scorer, max_features)
+        X_train_selected, _, y_train, _, scaler, selector = select_features(
+            features, labels, num_features_to_select, is_test)
+        support = selector.get_support(indices=True)
+        selected_names = [feature_names[i] for i in support]
+        pipeline = {'vectorizer': vectorizer, 'scaler': scaler, 'selector': selector}
+        selected = selector.transform(scaler.transform(features))
+        stored_pipeline = pipeline
+    else:
+        # Scaled and selected like the vectors already stored, so models trained on them stay valid
+        selected = transform_selected(df, scorer, pipeline)
+        X_train_selected, y_train = selected[~is_test], labels[~is_test]
+        support = pipeline['selector'].get_support(indices=True)
+        selected_names = current['feature_names']
+        stored_pipeline = bytes(current['pipeline'])
+
+    save_selected(os.path.join(FEATURES_DIR, 'selected_features.npz'), X_train_selected, y_train, selected_names)
+
+    # Store the selected features of every labelled user under a version derived from the fitted pipeline,
+    # so a new cycle through the same pipeline overwrites the same documents (and models trained on them
+    # can be updated incrementally); the vectors of a superseded feature set are dropped
+    version = store.register(selected_names, parameters, stored_pipeline,
+                             scale=pipeline['scaler'].max_abs_[support].tolist(),
+                             chi2_scores=pipeline['selector'].scores_[support].tolist(), source=snapshot_key(db))
+    store.write(version, df[['user_id', 'label', 'merged_at']], selected)
+    store.prune(keep=version)
+
+    print("Selected features:", ", ".join(selected_names))
+    print(f"Selected features have been saved to the feature store as feature set {version}.")
+    return selected_names
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Select features for the misleading-post classifier.")
+    parser.add_argument("--max-features", type=int, default=1000, help="TF-IDF vocabulary size")
+    parser.add_argument("--k", type=int, default=20, help="number of features to select")
+    parser.add_argument("--processes", type=int, default=None, help="worker processes for sentiment scoring")
+    parser.add_argument("--refit", action="store_true",
+                        help="refit the vectorizer, scaler and selector instead of reusing the stored ones")
+    Instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+    Instrumentation.configure_from_args(args)
+
+    # Connect to MongoDB
+    client = MongoClient('mongodb://localhost:27017/')
+    db = client['Tweet']
+    with stage('features'):
+        run(db, args.max_features, args.k, args.processes, args.refit)
+    client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import glob
+import hashlib
+import json
+import os
+
+from Data_Loader import load_merged
+
+# Directory holding the Arrow snapshots, next to the scripts
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'snapshots')
+
+# Per-user table shared by EDA, FeatureSelection and ML; bump SNAPSHOT_FORMAT when it changes
+SNAPSHOT_FIELDS = ['user_id', 'email_verified', 'has_notifications', 'created_at', 'bio',
+                   'num_following', 'num_followers', 'num_posts', 'num_comments', 'num_notifications',
+                   'label', 'post_content', 'post_length', 'month', 'merged_at']
+SNAPSHOT_FORMAT = 3
+
+
+def merged_version(db):
+    """Version stamp written by Data_Preprocessing every time it writes Merged."""
+    stamp = db['Watermarks'].find_one({"_id": "Merged"}) or {}
+    return str(stamp.get("version"))
+
+
+def snapshot_key(db):
+    """Content key of Merged: its version stamp, document count and the snapshot layout."""
+    state = {
+        'version': merged_version(db),
+        'count': db['Merged'].estimated_document_count(),
+        'fields': SNAPSHOT_FIELDS,
+        'format': SNAPSHOT_FORMAT,
+    }
+    return hashlib.sha1(json.dumps(state, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def snapshot_path(key, snapshot_dir=SNAPSHOT_DIR):
+    return os.path.join(snapshot_dir, f'merged-{key}.arrow')
+
+
+def materialize(db, snapshot_dir=SNAPSHOT_DIR):
+    """Write the per-user table for the current state of Merged, unless it already exists."""
+    from pyarrow import feather
+
+    path = snapshot_path(snapshot_key(db), snapshot_dir)
+    if os.path.exists(path):
+        return path
+
+    df = load_merged(db, SNAPSHOT_FIELDS)
+    os.makedirs(snapshot_dir, exist_ok=True)
+    # Uncompressed Arrow IPC can be memory-mapped without copying
+    tmp_path = path + '.tmp'
+    feather.write_feather(df, tmp_path, compression='uncompressed')
+    os.replace(tmp_path, path)
+
+    # Older snapshots are stale as soon as Merged changes
+    for stale in glob.glob(os.path.join(snapshot_dir, 'merged-*.arrow')):
+        if stale != path:
+            os.remove(stale)
+    return path
+
+
+def load_snapshot(db, fields, snapshot_dir=SNAPSHOT_DIR):
+    """Load `fields` of the per-user table from the snapshot, building it first if Merged changed.
+
+    Falls back to querying Merged when pyarrow is not installed or a field is not in the snapshot.
+    """
+    try:
+        from pyarrow import feather
+    except ImportError:
+        return load_merged(db, fields)
+    if not set(fields) <= set(SNAPSHOT_FIELDS):
+        return load_merged(db, fields)
+
+    path = materialize(db, snapshot_dir)
+    return feather.read_table(path, columns=list(fields), memory_map=True).to_pandas()
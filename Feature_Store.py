@@ -0,0 +1,136 @@
+import hashlib
+import json
+import pickle
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import pymongo
+from bson import Binary
+from pymongo import UpdateOne
+
+import Schema
+from Instrumentation import stage
+
+# Users per bulk write and per $in lookup
+WRITE_BATCH = 1000
+READ_BATCH = 10000
+
+
+def feature_set_version(feature_names, parameters, pipeline):
+    """Key of a feature set: the selected features, the selection parameters and the pickled fitted pipeline.
+
+    Writes through the same frozen pipeline keep the version and overwrite the vectors; a refit
+    (new scale, idf or vocabulary) gives a new version, so models trained on it start from scratch.
+    """
+    state = {'feature_names': list(feature_names), **parameters, 'pipeline': hashlib.sha1(pipeline).hexdigest()}
+    return hashlib.sha1(json.dumps(state, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:16]
+
+
+class FeatureStore:
+    """Per-user feature vectors keyed by (feature_set, user_id), with one metadata document per feature set.
+
+    The 'Features' collection holds one document per user and feature set, the vector packed as
+    float32 bytes so a bulk read is one np.frombuffer; 'FeatureSets' holds the column names and the
+    fitted vectorizer, scaler and selector that produced them. Only the vectors of the current feature set are kept.
+    """
+
+    def __init__(self, db):
+        self.features = db['Features']
+        self.feature_sets = db['FeatureSets']
+
+    def ensure_indexes(self):
+        self.features.create_index([("feature_set", pymongo.ASCENDING), ("user_id", pymongo.ASCENDING)], unique=True)
+        self.feature_sets.create_index([("registered_at", pymongo.DESCENDING)])
+
+    def register(self, feature_names, parameters, pipeline, **metadata):
+        """Store a feature set and return its version, derived from the names, the selection `parameters`
+        and `pipeline`, the fitted transformers (an object, or the bytes stored with an earlier version).
+
+        `metadata` (chi2 scores, the source snapshot) is refreshed on every registration without changing
+        the version; the last registered feature set becomes the current one.
+        """
+        if not isinstance(pipeline, bytes):
+            pipeline = pickle.dumps(pipeline, protocol=pickle.HIGHEST_PROTOCOL)
+        version = feature_set_version(feature_names, parameters, pipeline)
+        now = datetime.now(timezone.utc)
+        self.feature_sets.update_one(
+            {"_id": version},
+            {"$set": {"feature_names": list(feature_names), **parameters, "pipeline": Binary(pipeline), **metadata,
+                      "registered_at": now},
+             "$setOnInsert": {"created_at": now}},
+            upsert=True)
+        return version
+
+    @staticmethod
+    def pipeline(feature_set):
+        """Fitted transformers stored with a feature set (its metadata document), None for sets without."""
+        if feature_set is None or feature_set.get('pipeline') is None:
+            return None
+        return pickle.loads(bytes(feature_set['pipeline']))
+
+    def feature_set(self, version=None):
+        """Metadata of a feature set, the last registered one by default (None when nothing was stored)."""
+        if version is not None:
+            return self.feature_sets.find_one({"_id": version})
+        return self.feature_sets.find_one(sort=[("registered_at", pymongo.DESCENDING)])
+
+    def prune(self, keep):
+        """Delete the vectors of every feature set but `keep`; their metadata stays for reference."""
+        with stage('feature_store_prune') as metrics:
+            metrics.rows = self.features.delete_many({"feature_set": {"$ne": keep}}).deleted_count
+            self.feature_sets.update_many({"_id": {"$ne": keep}}, {"$set": {"n_users": 0}})
+        return metrics.rows
+
+    def write(self, version, rows, matrix, batch_size=WRITE_BATCH):
+        """Upsert one vector per row of `matrix` (dense or sparse); `rows` holds user_id and optionally
+        label and merged_at. Writing the same users again overwrites their vectors."""
+        matrix = np.asarray(matrix.toarray() if hasattr(matrix, 'toarray') else matrix, dtype=np.float32)
+        columns = [column for column in ('label', 'merged_at') if column in rows]
+        records = rows[['user_id'] + columns].astype(object).where(rows[['user_id'] + columns].notna(), None)
+        written = 0
+        with stage('feature_store_write') as metrics:
+            batch = []
+            for record, vector in zip(records.itertuples(index=False), matrix):
+                document = {"values": Binary(vector.tobytes()), **dict(zip(columns, record[1:]))}
+                batch.append(UpdateOne({"feature_set": version, "user_id": record[0]},
+                                       {"$set": document}, upsert=True))
+                if len(batch) == batch_size:
+                    self.features.bulk_write(batch, ordered=False)
+                    written += len(batch)
+                    batch = []
+            if batch:
+                self.features.bulk_write(batch, ordered=False)
+                written += len(batch)
+            metrics.rows = written
+        self.feature_sets.update_one({"_id": version}, {"$set": {"n_users": self.features.count_documents(
+            {"feature_set": version})}})
+        return written
+
+    def read(self, version=None, user_ids=None, batch_size=READ_BATCH):
+        """Stored rows of a feature set as (rows, matrix): a DataFrame of user_id, label and merged_at,
+        and the float32 feature matrix in the same order. Reads every user unless `user_ids` is given."""
+        feature_set = self.feature_set(version)
+        if feature_set is None:
+            raise ValueError("No feature set in the store; run FeatureSelection.py first.")
+        n_features = len(feature_set['feature_names'])
+        projection = {"_id": 0, "user_id": 1, "label": 1, "merged_at": 1, "values": 1}
+
+        if user_ids is None:
+            queries = [{"feature_set": feature_set['_id']}]
+        else:
+            user_ids = list(user_ids)
+            queries = [{"feature_set": feature_set['_id'], "user_id": {"$in": user_ids[start:start + batch_size]}}
+                       for start in range(0, len(user_ids), batch_size)]
+
+        keys, values = {'user_id': [], 'label': [], 'merged_at': []}, []
+        with stage('feature_store_read') as metrics:
+            for query in queries:
+                for document in self.features.find(query, projection, batch_size=batch_size):
+                    for key, column in keys.items():
+                        column.append(document.get(key))
+                    values.append(document['values'])
+            matrix = np.frombuffer(b''.join(values), dtype=np.float32).reshape(-1, n_features)
+            metrics.rows = len(matrix)
+        rows = pd.DataFrame({field: Schema.column(column, field) for field, column in keys.items()})
+        return rows, matrix
@@ -0,0 +1,58 @@
+import numpy as np
+from bson import Binary
+
+# Id-list fields and the count field stored next to each of them
+ID_LIST_FIELDS = {
+    'following_ids': 'num_following',
+    'followers_ids': 'num_followers',
+    'liked_ids': 'num_likes',
+}
+
+# Bytes per ObjectId
+OID_SIZE = 12
+
+
+def pack_ids(raw):
+    """Pack an (n, 12) uint8 array of ObjectIds into one BSON binary value."""
+    return Binary(np.ascontiguousarray(raw, dtype=np.uint8).tobytes())
+
+
+def pack_hex_ids(ids):
+    """Pack a list of 24-character hex ObjectIds (the original storage) into one BSON binary value."""
+    return Binary(bytes.fromhex(''.join(ids)))
+
+
+def id_count(value):
+    """Number of ids in a packed or list-valued id field (0 when missing)."""
+    if value is None:
+        return 0
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value) // OID_SIZE
+    return len(value)
+
+
+def unpack_ids(value):
+    """The ids of a packed or list-valued field as an (n, 12) uint8 array (a view for packed values)."""
+    if value is None:
+        return np.empty((0, OID_SIZE), dtype=np.uint8)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return np.frombuffer(value, dtype=np.uint8).reshape(-1, OID_SIZE)
+    return np.frombuffer(bytes.fromhex(''.join(value)), dtype=np.uint8).reshape(-1, OID_SIZE)
+
+
+def ids_as_hex(value):
+    """The ids as 24-character hex strings, e.g. to query the collections they point into."""
+    raw = unpack_ids(value)
+    return np.frombuffer(raw.tobytes().hex().encode('ascii'), dtype='S24').astype('U24').tolist()
+
+
+def compact_id_lists(document, pack=True):
+    """Add the count of each id-list field to the document and optionally pack list-valued fields."""
+    for field, count_field in ID_LIST_FIELDS.items():
+        if field not in document:
+            continue
+        value = document[field]
+        document[count_field] = id_count(value)
+        if pack and isinstance(value, list):
+            document[field] = pack_hex_ids(value)
+    return document
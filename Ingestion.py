@@ -0,0 +1,64 @@
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from Instrumentation import stage
+
+
+def iter_documents(chunks):
+    """Turn column chunks (dict of column -> array/list) into lists of documents."""
+    for columns in chunks:
+        names = list(columns)
+        # tolist() converts NumPy scalars to native Python types that BSON can encode
+        values = [col.tolist() if isinstance(col, np.ndarray) else col for col in columns.values()]
+        yield [dict(zip(names, row)) for row in zip(*values)]
+
+
+def iter_batches(document_lists, batch_size):
+    """Re-slice lists of documents into batches of exactly batch_size (the last may be shorter)."""
+    batch = []
+    for documents in document_lists:
+        for document in documents:
+            batch.append(document)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def stream_insert(collection, batches, max_in_flight=4):
+    """Insert batches with unordered bulk writes, keeping at most max_in_flight writes pending.
+
+    Batches are pulled lazily from the iterable, so generation of the next batch
+    overlaps with the writes already in flight and memory stays bounded by
+    roughly (max_in_flight + 1) batches.
+    """
+    start = time.perf_counter()
+    rows = 0
+    pending = deque()
+    with stage(f'ingest.{collection.name}') as metrics, ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        for batch in batches:
+            if len(pending) >= max_in_flight:
+                rows += pending.popleft().result()
+            pending.append(executor.submit(_insert_batch, collection, batch))
+        while pending:
+            rows += pending.popleft().result()
+        metrics.rows = rows
+
+    elapsed = time.perf_counter() - start
+    rate = rows / elapsed if elapsed > 0 else float('inf')
+    print(f"{collection.name}: inserted {rows} rows in {elapsed:.2f}s ({rate:,.0f} rows/sec)")
+    return {'collection': collection.name, 'rows': rows, 'seconds': elapsed, 'rows_per_sec': rate}
+
+
+def _insert_batch(collection, batch):
+    collection.insert_many(batch, ordered=False)
+    return len(batch)
+
+
+def ingest(collection, chunks, batch_size=5000, max_in_flight=4):
+    """Stream generator column chunks into a collection."""
+    return stream_insert(collection, iter_batches(iter_documents(chunks), batch_size), max_in_flight)
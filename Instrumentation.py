@@ -0,0 +1,250 @@
+import cProfile
+import functools
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from pymongo import monitoring
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+METRICS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'metrics')
+
+# Where stage metrics go; change with configure(). The settings are mirrored into the environment
+# so that worker processes (joblib, multiprocessing spawn) log to the same files
+settings = {
+    'log_path': os.environ.get('METRICS_LOG', os.path.join(METRICS_DIR, 'metrics.jsonl')),
+    'prometheus_path': os.environ.get('METRICS_PROMETHEUS') or None,
+    'profile_dir': os.environ.get('METRICS_PROFILE_DIR') or None,
+}
+
+_local = threading.local()
+_lock = threading.Lock()
+_latest = {}
+
+
+class MongoCommandCounter(monitoring.CommandListener):
+    """Counts commands sent to MongoDB, i.e. network round trips."""
+
+    def __init__(self):
+        self.count = 0
+        # Commands start on pymongo's and the workers' threads
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        with self._lock:
+            self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+# Registered before any MongoClient is created by the scripts that import this module
+mongo_commands = MongoCommandCounter()
+monitoring.register(mongo_commands)
+
+
+def configure(log_path=None, prometheus_path=None, profile=False, profile_dir=None):
+    """Set the JSON log, the optional Prometheus text file and per-stage cProfile output."""
+    if log_path:
+        settings['log_path'] = log_path
+    if prometheus_path:
+        settings['prometheus_path'] = prometheus_path
+    if profile:
+        settings['profile_dir'] = profile_dir or os.path.join(METRICS_DIR, 'profiles')
+    for key, variable in [('log_path', 'METRICS_LOG'), ('prometheus_path', 'METRICS_PROMETHEUS'),
+                          ('profile_dir', 'METRICS_PROFILE_DIR')]:
+        if settings[key]:
+            os.environ[variable] = settings[key]
+
+
+def add_arguments(parser):
+    """Add the --profile/--metrics-log/--prometheus options to a script's argument parser."""
+    parser.add_argument("--profile", action="store_true", help="write cProfile output for each top-level stage")
+    parser.add_argument("--metrics-log", default=None, help="JSON-lines file receiving the stage metrics")
+    parser.add_argument("--prometheus", default=None, help="also write the latest metrics as a Prometheus text file")
+
+
+def configure_from_args(args):
+    configure(args.metrics_log, args.prometheus, args.profile)
+
+
+def _peak_rss_bytes():
+    """Peak resident set size of this process, or None where it cannot be measured."""
+    # VmHWM is the peak resident set size since the last reset through clear_refs
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is not None:
+        # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+    try:
+        import psutil
+    except ImportError:
+        return None
+    # Windows reports the peak working set
+    return getattr(psutil.Process().memory_info(), 'peak_wset', None)
+
+
+def _reset_peak_rss():
+    """Restart the peak RSS at the current RSS; False where the peak cannot be reset."""
+    if not os.path.exists('/proc/self/clear_refs'):
+        return False
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        return False
+    return True
+
+
+class StageMetrics:
+    def __init__(self, name, rows=None):
+        self.name = name
+        self.rows = rows
+        self.timers = {}
+        self.child_peak_rss = 0
+        # RSS when the stage started, None where the peak cannot be reset per stage
+        self.start_rss = None
+
+    def add_timing(self, name, seconds, count=1):
+        timer = self.timers.setdefault(name, {'seconds': 0.0, 'count': 0})
+        timer['seconds'] += seconds
+        timer['count'] += count
+
+    def peak_rss_growth(self):
+        """Bytes the peak RSS rose above the RSS at the start of the stage so far, or None."""
+        peak = _peak_rss_bytes()
+        if self.start_rss is None or peak is None:
+            return None
+        return max(peak, self.child_peak_rss) - self.start_rss
+
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+def add_timing(name, seconds, count=1):
+    """Accumulate a fine-grained timing (e.g. one clean_text call) into the innermost open stage."""
+    stack = _stack()
+    if stack:
+        stack[-1].add_timing(name, seconds, count)
+
+
+@contextmanager
+def stage(name, rows=None):
+    """Measure a block: wall and CPU time, rows, peak RSS and MongoDB round trips.
+
+    Set `.rows` on the yielded object when the row count is only known at the end.
+    """
+    stack = _stack()
+    metrics = StageMetrics(name, rows)
+    profiler = None
+    if settings['profile_dir'] and not stack:
+        profiler = cProfile.Profile()
+    if stack:
+        # Keep the parent's peak so far before the counter is reset for this stage
+        stack[-1].child_peak_rss = max(stack[-1].child_peak_rss, _peak_rss_bytes() or 0)
+    if _reset_peak_rss():
+        metrics.start_rss = _peak_rss_bytes()
+    stack.append(metrics)
+
+    commands = mongo_commands.count
+    start, cpu_start = time.perf_counter(), time.process_time()
+    if profiler:
+        profiler.enable()
+    try:
+        yield metrics
+    finally:
+        if profiler:
+            profiler.disable()
+        wall, cpu = time.perf_counter() - start, time.process_time() - cpu_start
+        stack.pop()
+        # None when peak memory is unavailable on this platform
+        peak = max(_peak_rss_bytes() or 0, metrics.child_peak_rss) or None
+        if stack and peak:
+            stack[-1].child_peak_rss = max(stack[-1].child_peak_rss, peak)
+
+        record = {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'stage': '.'.join([parent.name for parent in stack] + [name]),
+            'seconds': wall,
+            'cpu_seconds': cpu,
+            'rows': metrics.rows,
+            'rows_per_sec': metrics.rows / wall if metrics.rows and wall > 0 else None,
+            'peak_rss_bytes': peak,
+            'mongo_round_trips': mongo_commands.count - commands,
+            'pid': os.getpid(),
+        }
+        if metrics.timers:
+            record['timers'] = metrics.timers
+        if profiler:
+            os.makedirs(settings['profile_dir'], exist_ok=True)
+            record['profile'] = os.path.join(settings['profile_dir'],
+                                             f"{record['stage']}-{int(time.time())}-{os.getpid()}.prof")
+            profiler.dump_stats(record['profile'])
+        _emit(record)
+
+
+def instrument(name=None):
+    """Decorator form of stage(); the stage name defaults to the function name."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name or func.__name__):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def last_record(stage_name):
+    """The most recent record emitted by this process for a (dotted) stage name, or None."""
+    with _lock:
+        return _latest.get(stage_name)
+
+
+def _emit(record):
+    with _lock:
+        if settings['log_path']:
+            os.makedirs(os.path.dirname(settings['log_path']) or '.', exist_ok=True)
+            with open(settings['log_path'], 'a') as f:
+                f.write(json.dumps(record) + '\n')
+        _latest[record['stage']] = record
+        # Worker processes only append to the JSON log; the parent owns the Prometheus file
+        if settings['prometheus_path'] and multiprocessing.parent_process() is None:
+            _write_prometheus(settings['prometheus_path'])
+
+
+def _write_prometheus(path):
+    metrics = [('pipeline_stage_seconds', 'seconds'), ('pipeline_stage_rows', 'rows'),
+               ('pipeline_stage_peak_rss_bytes', 'peak_rss_bytes'),
+               ('pipeline_stage_mongo_round_trips', 'mongo_round_trips')]
+    lines = []
+    for metric, key in metrics:
+        lines.append(f'# TYPE {metric} gauge')
+        for stage_name, record in sorted(_latest.items()):
+            if record.get(key) is not None:
+                lines.append(f'{metric}{{stage="{stage_name}"}} {record[key]}')
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(tmp_path, path)
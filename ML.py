@@ -1,112 +1,325 @@
+import argparse
+import time
+import numpy as np
 import pandas as pd
 from pymongo import MongoClient
-from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
-from sklearn.svm import SVC
-from sklearn.neighbors import KNeighborsClassifier
-from sklearn.linear_model import LogisticRegression
-from sklearn.tree import DecisionTreeClassifier
-from sklearn.naive_bayes import GaussianNB
-from sklearn.metrics import accuracy_score, confusion_matrix, classification_report
-import matplotlib.pyplot as plt
-import seaborn as sns
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import tkinter as tk
-from tkinter import ttk
-
-# Connect to MongoDB
-client = MongoClient('mongodb://localhost:27017/')
-db = client['Tweet']  # Replace 'Tweet' with your actual database name
-
-# Fetch data from 'Merged' collection
-merged_collection = db['Merged']  # Replace 'Merged' with your actual collection name
-merged_data = list(merged_collection.find())
-
-# Convert merged data to DataFrame
-data_flat = pd.DataFrame(merged_data)
-
-# Create new columns using the count function
-data_flat['num_posts'] = data_flat['posts'].apply(len)
-data_flat['num_followers'] = data_flat['followers_ids'].apply(len)
-data_flat['num_following'] = data_flat['following_ids'].apply(len)
-data_flat['num_comments'] = data_flat['comments'].apply(len)
-
-# Access the nested 'label' column from the first post
-data_flat['label'] = data_flat['posts'].apply(lambda x: x[0]['label'] if len(x) > 0 else None)
-
-# Filter out rows where the 'label' is None
-data_flat = data_flat[data_flat['label'].notnull()]
+import Instrumentation
+from Feature_Snapshot import load_snapshot
+from Feature_Store import FeatureStore
+from FeatureSelection import HASH_FEATURES, iter_feature_chunks, stream_feature_columns
+from Instrumentation import stage
+from Model_Registry import ModelRegistry, incremental_fit
+from Sentiment import SentimentScorer
+from Social_Graph import GRAPH_FEATURES, graph_features, join_graph_features
+from Training import (REPORT_PATH, CLASSES, add_metrics, default_classifiers, is_test_user, streaming_classifiers,
+                      train_jobs, write_report, load_report)
 
 # Extract features and labels
-feature_columns = ['num_posts', 'num_followers', 'num_following', 'num_comments', 'has_notifications']
+feature_columns = ['num_posts', 'num_followers', 'num_following', 'num_comments', 'has_notifications'] + GRAPH_FEATURES
+snapshot_columns = [column for column in feature_columns if column not in GRAPH_FEATURES]
 label_column = 'label'
-features = data_flat[feature_columns]
-labels = data_flat[label_column]
-
-# Split the data into training and testing sets
-X_train, X_test, y_train, y_test = train_test_split(features, labels, test_size=0.2, random_state=42)
-
-# Define a list of classifiers
-classifiers = [
-    RandomForestClassifier(random_state=42),
-    GradientBoostingClassifier(random_state=42),
-    SVC(),
-    KNeighborsClassifier(),
-    LogisticRegression(),
-    DecisionTreeClassifier(random_state=42),
-    GaussianNB()
-]
-
-# Create a Tkinter root window
-root = tk.Tk()
-root.title("Classifier Evaluation")
-
-# Create a Notebook widget to hold tabs
-notebook = ttk.Notebook(root)
-notebook.pack(fill=tk.BOTH, expand=True)
-
-# Loop through each classifier and train and evaluate
-for clf in classifiers:
-    tab = ttk.Frame(notebook)
-    notebook.add(tab, text=clf.__class__.__name__)
-
-    fig, axes = plt.subplots(1, 2, figsize=(15, 5))
-
-    clf.fit(X_train, y_train)
-    y_pred = clf.predict(X_test)
-
-    accuracy = accuracy_score(y_test, y_pred)
-
-    conf_matrix = confusion_matrix(y_test, y_pred)
-    sns.heatmap(conf_matrix, annot=True, cmap='Blues', fmt='g', ax=axes[0])
-    axes[0].set_title(f'Confusion Matrix - {clf.__class__.__name__}')
-    axes[0].set_xlabel('Predicted Label')
-    axes[0].set_ylabel('Actual Label')
-
-    class_report = classification_report(y_test, y_pred, zero_division=1)
-    print(f"Classifier: {clf.__class__.__name__}")
-    print("Classification Report:\n", class_report)
-    print("Confusion Matrix:\n", conf_matrix)
-
-    report_lines = class_report.split('\n')[2:-3]
-    metrics_data = [line.split()[1:] for line in report_lines]
-    metrics_df = pd.DataFrame(metrics_data, columns=['Precision', 'Recall', 'F1-Score', 'Support'])
-    metrics_df = metrics_df.astype({'Precision': float, 'Recall': float, 'F1-Score': float, 'Support': float})
-    metrics_df.plot(kind='bar', colormap='Paired', ax=axes[1])
-    axes[1].set_title(f'Metrics - {clf.__class__.__name__}')
-    axes[1].set_xlabel('Metric')
-    axes[1].set_ylabel('Score')
-
-    # Display the figure in the Notebook tab
-    canvas = FigureCanvasTkAgg(fig, master=tab)
-    canvas_widget = canvas.get_tk_widget()
-    canvas_widget.pack(fill=tk.BOTH, expand=True)
-
-    # Close the figure after displaying
-    plt.close(fig)
-
-# Close the MongoDB connection
-client.close()
-
-# Start the Tkinter main loop
-root.mainloop()
+
+
+def load_training_data(db):
+    """Labelled users, split into train/test sets; the split is stable as new users arrive."""
+    # Fetch the feature columns from the local snapshot of the 'Merged' collection
+    # (rebuilt when Merged changes); the counts and the label of the first post are derived by the loader
+    data_flat = load_snapshot(db, ['user_id', 'merged_at'] + snapshot_columns + [label_column])
+
+    # Filter out rows where the 'label' is None; the remaining labels fit a plain integer column
+    data_flat = data_flat[data_flat['label'].notnull()].astype({label_column: 'int64'})
+
+    # Social-graph features (PageRank, reciprocity, like-ring density) from the incrementally updated graph
+    data_flat = join_graph_features(data_flat, graph_features(db))
+
+    is_test = is_test_user(data_flat['user_id'])
+    return data_flat[~is_test], data_flat[is_test]
+
+
+def load_store_training_data(db, version=None):
+    """Labelled users of a feature set of the feature store (the newest by default), split like
+    load_training_data; returns (train_data, test_data, feature columns, version)."""
+    store = FeatureStore(db)
+    feature_set = store.feature_set(version)
+    if feature_set is None:
+        raise ValueError("No feature set in the store; run FeatureSelection.py first.")
+    rows, matrix = store.read(feature_set['_id'])
+    columns = feature_set['feature_names']
+    data_flat = pd.concat([rows, pd.DataFrame(matrix, columns=columns)], axis=1)
+    data_flat = data_flat[data_flat['label'].notnull()].astype({label_column: 'int64'})
+
+    is_test = is_test_user(data_flat['user_id'])
+    return data_flat[~is_test], data_flat[is_test], columns, feature_set['_id']
+
+
+def _megabytes(value):
+    return 'n/a' if value is None else f"{value:.1f} MB"
+
+
+def registered_accuracy(entry, X_test, y_test):
+    """Accuracy of a registered model on the current test users (the split is fixed per user)."""
+    from sklearn.metrics import accuracy_score
+
+    return accuracy_score(y_test, entry['model'].predict(X_test))
+
+
+def train(db, n_jobs=-1, cv=0, report_path=REPORT_PATH, incremental=False, registry=None, feature_store=False):
+    """Headless run: fit every classifier concurrently and write the results to the report file.
+
+    With incremental=True, models saved in the registry are updated with the users merged since
+    their watermark (partial_fit or warm_start); the others are retrained on the full training set,
+    as are updated models that score worse on the test users than the registered ones.
+    With feature_store=True, the features selected by FeatureSelection.py are read from the feature
+    store instead of the snapshot columns.
+    """
+    registry = registry or ModelRegistry()
+    if feature_store:
+        train_data, test_data, columns, feature_set = load_store_training_data(db)
+    else:
+        train_data, test_data = load_training_data(db)
+        columns, feature_set = feature_columns, None
+    X_train, y_train = train_data[columns], train_data[label_column]
+    X_test, y_test = test_data[columns], test_data[label_column]
+    watermark = train_data['merged_at'].max()
+
+    jobs = []
+    for clf in default_classifiers():
+        entry = registry.load(clf.__class__.__name__) if incremental else None
+        if registry.can_update(entry, columns, feature_set):
+            new_data = train_data[train_data['merged_at'] > entry['watermark']]
+            jobs.append((entry['model'], new_data[columns], new_data[label_column], incremental_fit))
+        else:
+            jobs.append((clf, X_train, y_train, None))
+    results, fitted = train_jobs(jobs, X_test, y_test, n_jobs=n_jobs, cv=cv)
+
+    # Warm starts can drift: an update less accurate than the registered model is replaced by a full refit
+    regressed = []
+    for i, result in enumerate(results):
+        if result['incremental'] and result['fitted']:
+            previous = registered_accuracy(registry.load(result['classifier']), X_test, y_test)
+            if result['accuracy'] < previous:
+                print(f"{result['classifier']}: update scored {result['accuracy']:.3f} below the registered "
+                      f"{previous:.3f}; refitting on the full training set")
+                regressed.append(i)
+    if regressed:
+        classifiers = {clf.__class__.__name__: clf for clf in default_classifiers()}
+        refit_jobs = [(classifiers[results[i]['classifier']], X_train, y_train, None) for i in regressed]
+        refit_results, refit_models = train_jobs(refit_jobs, X_test, y_test, n_jobs=n_jobs, cv=cv)
+        for i, result, clf in zip(regressed, refit_results, refit_models):
+            result['rejected_update_accuracy'] = results[i]['accuracy']
+            results[i], fitted[i] = result, clf
+
+    for result, clf in zip(results, fitted):
+        name = result['classifier']
+        entry = registry.load(name) if result['incremental'] else None
+        if entry and not result['fitted']:
+            # The batch was not learned (e.g. it lacks a class): keep the watermark so its rows stay pending
+            model_watermark, n_samples = entry['watermark'], entry['n_samples']
+        else:
+            model_watermark = watermark
+            n_samples = entry['n_samples'] + result['fit_rows'] if entry else result['fit_rows']
+        registry.save(name, clf, columns, model_watermark, n_samples, {'accuracy': result['accuracy']},
+                      feature_set=feature_set)
+
+        print(f"Classifier: {name}")
+        print(f"Fit ({'incremental, ' if result['incremental'] else ''}{result['fit_rows']} rows"
+              f"{', kept pending' if result['fit_rows'] and not result['fitted'] else ''}): "
+              f"{result['fit_seconds']:.2f}s ({_megabytes(result['fit_peak_mb'])} peak), "
+              f"predict: {result['predict_us_per_row']:.1f} us/row")
+        if 'cv_mean' in result:
+            print(f"{cv}-fold CV accuracy: {result['cv_mean']:.3f} +/- {result['cv_std']:.3f}")
+        print("Classification Report:\n", result['classification_report_text'])
+        print("Confusion Matrix:\n", result['confusion_matrix'])
+
+    write_report(results, report_path, n_train=len(y_train), n_test=len(y_test), features=columns, cv=cv,
+                 feature_set=feature_set)
+    print(f"Report written to {report_path}")
+    return results, fitted
+
+
+def train_out_of_core(db, chunk_size=10000, n_features=HASH_FEATURES, report_path=REPORT_PATH,
+                      incremental=False, registry=None, processes=None):
+    """Out-of-core run: stream Merged chunk by chunk and partial_fit the streaming classifiers.
+
+    Features are the numeric ones plus the hashed post content, so nothing is fitted up front and only one
+    chunk is held in memory. A first pass trains on the training users of each chunk, a second pass
+    predicts the test users. With incremental=True, saved models only see the users merged since their
+    watermark.
+    """
+    registry = registry or ModelRegistry()
+    columns = stream_feature_columns(n_features)
+    scorer = SentimentScorer(cache=db['Sentiment'], processes=processes)
+    graph = graph_features(db)
+
+    states = []
+    for clf in streaming_classifiers():
+        name = f'{clf.__class__.__name__}OutOfCore'
+        entry = registry.load(name) if incremental else None
+        if registry.can_update(entry, columns):
+            states.append({'name': name, 'model': entry['model'], 'watermark': entry['watermark'],
+                           'n_samples': entry['n_samples'], 'incremental': True})
+        else:
+            states.append({'name': name, 'model': clf, 'watermark': None, 'n_samples': 0, 'incremental': False})
+        states[-1].update(fit_rows=0, fit_seconds=0.0, predict_seconds=0.0, predictions=[])
+
+    # Only users merged after the oldest watermark are read when every model is updated incrementally
+    watermarks = [state['watermark'] for state in states]
+    query = None if None in watermarks else {'merged_at': {'$gt': pd.Timestamp(min(watermarks)).to_pydatetime()}}
+
+    watermark = None
+    with stage('fit_out_of_core') as metrics:
+        metrics.rows = 0
+        for users, features in iter_feature_chunks(db, scorer, graph, n_features, chunk_size, query):
+            is_train = ~is_test_user(users['user_id'])
+            labels = users['label'].to_numpy(dtype=np.int64)
+            merged_at = users['merged_at'].to_numpy()
+            watermark = max(watermark, merged_at.max()) if watermark is not None else merged_at.max()
+            for state in states:
+                rows = is_train
+                if state['watermark'] is not None:
+                    rows = rows & (merged_at > np.datetime64(state['watermark']))
+                if not rows.any():
+                    continue
+                start = time.perf_counter()
+                state['model'].partial_fit(features[rows], labels[rows], classes=CLASSES)
+                state['fit_seconds'] += time.perf_counter() - start
+                state['fit_rows'] += int(rows.sum())
+            metrics.rows += len(users)
+
+    states = [state for state in states if state['incremental'] or state['fit_rows']]
+    if not states:
+        print("No labelled users to train on.")
+        return []
+
+    y_test = []
+    with stage('predict_out_of_core') as metrics:
+        metrics.rows = 0
+        for users, features in iter_feature_chunks(db, scorer, graph, n_features, chunk_size):
+            is_test = is_test_user(users['user_id'])
+            if not is_test.any():
+                continue
+            y_test.append(users['label'].to_numpy(dtype=np.int64)[is_test])
+            for state in states:
+                start = time.perf_counter()
+                state['predictions'].append(state['model'].predict(features[is_test]))
+                state['predict_seconds'] += time.perf_counter() - start
+            metrics.rows += int(is_test.sum())
+    y_test = np.concatenate(y_test) if y_test else np.empty(0, dtype=np.int64)
+
+    results = []
+    for state in states:
+        name = state['name']
+        result = {'classifier': name, 'fit_rows': state['fit_rows'], 'incremental': state['incremental'],
+                  'fit_seconds': state['fit_seconds'], 'predict_seconds': state['predict_seconds'],
+                  'predict_us_per_row': 1e6 * state['predict_seconds'] / max(len(y_test), 1)}
+        if len(y_test):
+            y_pred = np.concatenate(state['predictions'])
+            add_metrics(result, y_test, y_pred)
+        results.append(result)
+
+        model_watermark = state['watermark'] if watermark is None else pd.Timestamp(watermark)
+        registry.save(name, state['model'], columns, model_watermark, state['n_samples'] + state['fit_rows'],
+                      {'accuracy': result.get('accuracy')})
+
+        print(f"Classifier: {name}")
+        print(f"Fit ({'incremental, ' if state['incremental'] else ''}out of core, {state['fit_rows']} rows): "
+              f"{state['fit_seconds']:.2f}s, predict: {result['predict_us_per_row']:.1f} us/row")
+        if len(y_test):
+            print("Classification Report:\n", result['classification_report_text'])
+            print("Confusion Matrix:\n", result['confusion_matrix'])
+
+    write_report(results, report_path, n_test=len(y_test), features=columns, out_of_core=True, chunk_size=chunk_size)
+    print(f"Report written to {report_path}")
+    return results
+
+
+def show_report(report):
+    """Render precomputed results, one Notebook tab per classifier."""
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+    import tkinter as tk
+    from tkinter import ttk
+
+    # Create a Tkinter root window
+    root = tk.Tk()
+    root.title("Classifier Evaluation")
+
+    # Create a Notebook widget to hold tabs
+    notebook = ttk.Notebook(root)
+    notebook.pack(fill=tk.BOTH, expand=True)
+
+    for result in report['results']:
+        name = result['classifier']
+        tab = ttk.Frame(notebook)
+        notebook.add(tab, text=name)
+
+        fig, axes = plt.subplots(1, 2, figsize=(15, 5))
+
+        sns.heatmap(result['confusion_matrix'], annot=True, cmap='Blues', fmt='g', ax=axes[0])
+        axes[0].set_title(f'Confusion Matrix - {name}')
+        axes[0].set_xlabel('Predicted Label')
+        axes[0].set_ylabel('Actual Label')
+
+        # Per-class rows of the classification report
+        class_rows = {label: metrics for label, metrics in result['classification_report'].items()
+                      if label not in ('accuracy', 'macro avg', 'weighted avg')}
+        metrics_df = pd.DataFrame.from_dict(class_rows, orient='index')
+        metrics_df.columns = ['Precision', 'Recall', 'F1-Score', 'Support']
+        metrics_df.plot(kind='bar', colormap='Paired', ax=axes[1])
+        axes[1].set_title(f'Metrics - {name}')
+        axes[1].set_xlabel('Metric')
+        axes[1].set_ylabel('Score')
+
+        # Display the figure in the Notebook tab
+        canvas = FigureCanvasTkAgg(fig, master=tab)
+        canvas_widget = canvas.get_tk_widget()
+        canvas_widget.pack(fill=tk.BOTH, expand=True)
+
+        # Close the figure after displaying
+        plt.close(fig)
+
+    # Start the Tkinter main loop
+    root.mainloop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train and compare the misleading-post classifiers.")
+    parser.add_argument("--headless", action="store_true", help="train and write the report without opening the viewer")
+    parser.add_argument("--view-only", action="store_true", help="open the viewer on the last report without training")
+    parser.add_argument("--n-jobs", type=int, default=-1, help="classifiers fitted in parallel (-1: all cores)")
+    parser.add_argument("--cv", type=int, default=0, help="k for k-fold cross-validation on the training split")
+    parser.add_argument("--report", default=REPORT_PATH, help="path of the JSON report")
+    parser.add_argument("--incremental", action="store_true",
+                        help="update saved models with the users merged since they were trained")
+    parser.add_argument("--feature-store", action="store_true",
+                        help="train on the newest feature set written by FeatureSelection.py")
+    parser.add_argument("--out-of-core", action="store_true",
+                        help="stream Merged in chunks through hashed features and partial_fit streaming models")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="users per chunk in out-of-core mode")
+    parser.add_argument("--hash-features", type=int, default=HASH_FEATURES,
+                        help="hashed post-content columns in out-of-core mode")
+    Instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+    Instrumentation.configure_from_args(args)
+
+    if not args.view_only:
+        # Connect to MongoDB
+        client = MongoClient('mongodb://localhost:27017/')
+        db = client['Tweet']  # Replace 'Tweet' with your actual database name
+        with stage('train'):
+            if args.out_of_core:
+                train_out_of_core(db, args.chunk_size, args.hash_features, args.report, incremental=args.incremental)
+            else:
+                train(db, args.n_jobs, args.cv, args.report, incremental=args.incremental,
+                      feature_store=args.feature_store)
+
+        # Close the MongoDB connection
+        client.close()
+
+    if not args.headless:
+        show_report(load_report(args.report))
+
+
+if __name__ == "__main__":
+    main()
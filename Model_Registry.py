@@ -0,0 +1,96 @@
+import os
+from datetime import datetime, timezone
+
+# Fitted models are stored next to the scripts, one file per classifier
+REGISTRY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
+
+# Trees/stages added to a warm-started forest or boosting model for each new batch
+WARM_START_ESTIMATORS = 10
+
+# Warm-started models growing past this many trees/stages are refitted from scratch instead, which
+# bounds their size and scoring latency
+MAX_ESTIMATORS = 300
+
+
+def supports_incremental(model):
+    """True for models that can learn from a new batch without seeing the old data again."""
+    if hasattr(model, 'partial_fit'):
+        return True
+    params = model.get_params()
+    return 'warm_start' in params and 'n_estimators' in params
+
+
+def incremental_fit(model, X_new, y_new):
+    """Update a fitted model with a new batch: partial_fit when available, otherwise warm_start.
+
+    Returns (model, fitted); fitted is False when the batch could not be learned, in which case its
+    rows should stay pending for a later batch.
+    """
+    if len(y_new) == 0:
+        return model, False
+    if hasattr(model, 'partial_fit'):
+        return model.partial_fit(X_new, y_new), True
+
+    # New trees/stages need every known class in the batch, otherwise their outputs would not line up
+    if set(getattr(model, 'classes_', [])) - set(y_new):
+        return model, False
+    model.set_params(warm_start=True, n_estimators=model.n_estimators + WARM_START_ESTIMATORS)
+    return model.fit(X_new, y_new), True
+
+
+def _can_grow(model):
+    # partial_fit models keep a fixed size; warm-started ones add WARM_START_ESTIMATORS per batch
+    return hasattr(model, 'partial_fit') or model.n_estimators + WARM_START_ESTIMATORS <= MAX_ESTIMATORS
+
+
+class ModelRegistry:
+    """Serializes fitted models together with their feature schema and data watermark."""
+
+    def __init__(self, directory=REGISTRY_DIR):
+        self.directory = directory
+
+    def path(self, name):
+        return os.path.join(self.directory, f'{name}.joblib')
+
+    def save(self, name, model, feature_columns, watermark, n_samples, metrics=None, feature_set=None):
+        os.makedirs(self.directory, exist_ok=True)
+        entry = {
+            'name': name,
+            'model': model,
+            'feature_columns': list(feature_columns),
+            # Feature-store version the columns are read from (None: computed from Merged documents)
+            'feature_set': feature_set,
+            # Newest merged_at of the data the model has seen
+            'watermark': watermark,
+            'n_samples': n_samples,
+            'metrics': metrics or {},
+            'trained_at': datetime.now(timezone.utc),
+        }
+        import joblib
+
+        tmp_path = self.path(name) + '.tmp'
+        joblib.dump(entry, tmp_path)
+        os.replace(tmp_path, self.path(name))
+        return entry
+
+    def load(self, name):
+        """Registry entry of a model, or None when it was never saved."""
+        if not os.path.exists(self.path(name)):
+            return None
+        # joblib (and the model's own modules) are only imported once a model is actually read
+        import joblib
+
+        return joblib.load(self.path(name))
+
+    def names(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(f[:-len('.joblib')] for f in os.listdir(self.directory) if f.endswith('.joblib'))
+
+    def can_update(self, entry, feature_columns, feature_set=None):
+        """An entry can be updated incrementally when its schema matches, its model supports it and
+        has not reached MAX_ESTIMATORS."""
+        return (entry is not None and entry['feature_columns'] == list(feature_columns)
+                and entry.get('feature_set') == feature_set
+                and entry['watermark'] is not None and supports_incremental(entry['model'])
+                and _can_grow(entry['model']))
@@ -0,0 +1,196 @@
+import argparse
+import time
+import traceback
+from importlib import import_module
+
+from pymongo import MongoClient
+
+import Instrumentation
+
+
+class Stage:
+    def __init__(self, name, func, depends_on=()):
+        self.name = name
+        self.func = func
+        self.depends_on = list(depends_on)
+
+
+def topological_order(stages):
+    """Stages ordered so that every stage runs after its dependencies."""
+    by_name = {stage.name: stage for stage in stages}
+    ordered, visiting, done = [], set(), set()
+
+    def visit(stage):
+        if stage.name in done:
+            return
+        if stage.name in visiting:
+            raise ValueError(f"Pipeline has a cycle through stage {stage.name!r}")
+        visiting.add(stage.name)
+        for dependency in stage.depends_on:
+            if dependency in by_name:
+                visit(by_name[dependency])
+        visiting.discard(stage.name)
+        done.add(stage.name)
+        ordered.append(stage)
+
+    for stage in stages:
+        visit(stage)
+    return ordered
+
+
+def _preprocess(db, args):
+    Data_Preprocessing = import_module('Data_Preprocessing')
+    Data_Preprocessing.COMPACT_IDS = args.compact_ids
+    Data_Preprocessing.BUCKETED = not args.embedded
+    Data_Preprocessing.ensure_indexes(db)
+    Data_Preprocessing.merge_incremental(db, workers=args.workers)
+
+
+def _eda(db):
+    EDA = import_module('EDA')
+    EDA.write_report(EDA.load_aggregates(db))
+
+
+def default_stages(args):
+    """collection -> preprocessing and social graph -> feature selection / training / EDA report.
+
+    Stage modules are imported when their stage first runs, so only the selected stages pay for
+    their imports (scikit-learn, nltk, matplotlib) and --dry-run pays for none of them.
+    """
+    return [
+        Stage('collect', lambda db: import_module('Data_Collection').create_data(
+            db, n_users=args.n_users, n_posts=args.n_posts, n_comments=args.n_comments,
+            n_notifications=args.n_notifications, seed=args.seed, compact_ids=args.compact_ids)),
+        Stage('preprocess', lambda db: _preprocess(db, args), depends_on=['collect']),
+        Stage('graph', lambda db: import_module('Social_Graph').graph_features(db), depends_on=['collect']),
+        Stage('features', lambda db: import_module('FeatureSelection').run(db, args.max_features, args.k),
+              depends_on=['preprocess', 'graph']),
+        # With --feature-store the models are trained on the vectors written by the features stage
+        Stage('train', lambda db: import_module('ML').train_out_of_core(db, args.chunk_size, incremental=True)
+              if args.out_of_core else
+              import_module('ML').train(db, n_jobs=args.n_jobs, incremental=True, feature_store=args.feature_store),
+              depends_on=['preprocess', 'graph'] + (['features'] if args.feature_store else [])),
+        # Cheap while Merged is unchanged: the aggregates are cached by snapshot key
+        Stage('eda', _eda, depends_on=['preprocess']),
+    ]
+
+
+def print_plan(stages):
+    """Print the stages in run order with the dependencies they wait for."""
+    names = {stage.name for stage in stages}
+    for position, stage in enumerate(topological_order(stages), 1):
+        waits_for = [dependency for dependency in stage.depends_on if dependency in names]
+        print(f"{position}. {stage.name}" + (f" (after {', '.join(waits_for)})" if waits_for else ""))
+
+
+class PipelineRunner:
+    """Runs the stages in-process against one shared database handle and times each of them."""
+
+    def __init__(self, stages, db):
+        self.stages = topological_order(stages)
+        self.db = db
+        self.history = []
+
+    def run_once(self):
+        timings = {}
+        failed = set()
+        for stage in self.stages:
+            # A stage whose dependency failed (or was skipped) is skipped as well
+            if failed.intersection(stage.depends_on):
+                failed.add(stage.name)
+                print(f"[{stage.name}] skipped: a dependency failed")
+                continue
+            start = time.perf_counter()
+            try:
+                # Each pipeline stage is a top-level instrumentation stage (and cProfile unit)
+                with Instrumentation.stage(stage.name):
+                    stage.func(self.db)
+            except Exception:
+                failed.add(stage.name)
+                traceback.print_exc()
+            timings[stage.name] = time.perf_counter() - start
+            status = 'failed' if stage.name in failed else 'done'
+            print(f"[{stage.name}] {status} in {timings[stage.name]:.2f}s")
+        self.history.append({'timings': timings, 'failed': sorted(failed)})
+        print(f"Pipeline run finished in {sum(timings.values()):.2f}s")
+        return timings, failed
+
+    def run_forever(self, interval, on_overrun='coalesce'):
+        """Run every `interval` seconds.
+
+        A run never overlaps another. If a run takes longer than the interval, the ticks it
+        missed are either coalesced into one immediate run ('coalesce') or dropped so the
+        next run starts on the following tick boundary ('skip').
+        """
+        next_run = time.monotonic()
+        while True:
+            delay = next_run - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            started = time.monotonic()
+            self.run_once()
+            finished = time.monotonic()
+
+            missed = int((finished - started) // interval)
+            if missed == 0:
+                next_run = started + interval
+            elif on_overrun == 'coalesce':
+                print(f"Run overran the interval; coalescing {missed} missed tick(s) into one run")
+                next_run = finished
+            else:
+                print(f"Run overran the interval; skipping {missed} tick(s)")
+                next_run = started + interval * (missed + 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run collection, preprocessing, feature selection and training.")
+    parser.add_argument("--once", action="store_true", help="run the pipeline once and exit")
+    parser.add_argument("--interval-minutes", type=float, default=15)
+    parser.add_argument("--on-overrun", choices=["coalesce", "skip"], default="coalesce",
+                        help="what to do with ticks that fire while a run is still in progress")
+    parser.add_argument("--stages", default="collect,preprocess,graph,features,train",
+                        help="comma-separated stages to run (collect, preprocess, graph, features, train, eda)")
+    parser.add_argument("--n-users", type=int, default=10000)
+    parser.add_argument("--n-posts", type=int, default=10000)
+    parser.add_argument("--n-comments", type=int, default=50000)
+    parser.add_argument("--n-notifications", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=1, help="preprocessing worker processes")
+    parser.add_argument("--compact-ids", action="store_true",
+                        help="store following/followers/liked ids as packed binary ObjectIds")
+    parser.add_argument("--embedded", action="store_true",
+                        help="embed posts, comments and notifications in Merged instead of bucketing them")
+    parser.add_argument("--max-features", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--n-jobs", type=int, default=-1, help="classifiers trained in parallel")
+    parser.add_argument("--feature-store", action="store_true",
+                        help="train on the features stored by the features stage instead of recomputing them")
+    parser.add_argument("--out-of-core", action="store_true",
+                        help="train streaming models chunk by chunk instead of loading the training set")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="users per chunk with --out-of-core")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="print the stages in run order and exit without importing them or connecting")
+    Instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+
+    selected = set(args.stages.split(','))
+    stages = [stage for stage in default_stages(args) if stage.name in selected]
+    if args.dry_run:
+        print_plan(stages)
+        return
+    Instrumentation.configure_from_args(args)
+
+    # One connection shared by every stage
+    client = MongoClient('mongodb://localhost:27017/')
+    runner = PipelineRunner(stages, client['Tweet'])
+    try:
+        if args.once:
+            runner.run_once()
+        else:
+            runner.run_forever(args.interval_minutes * 60, args.on_overrun)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# Arrow-backed strings take one contiguous buffer instead of a Python object per value
+try:
+    import pyarrow  # noqa: F401
+    STRING = pd.StringDtype('pyarrow')
+except ImportError:
+    STRING = pd.StringDtype('python')
+
+DATETIME = np.dtype('datetime64[us]')
+
+# Canonical dtype of every per-user field of Merged, as stored and as derived by Data_Loader.
+# Dates are BSON datetimes (NaT when missing), counts fit in int32 (0 when null), and the label and month of
+# users without posts or dates stay missing in nullable integer columns instead of turning into floats.
+MERGED_SCHEMA = {
+    'user_id': STRING,
+    'name': STRING,
+    'username': STRING,
+    'bio': STRING,
+    'email': STRING,
+    'image': STRING,
+    'cover_image': STRING,
+    'profile_image': STRING,
+    'hashed_password': STRING,
+    'post_content': STRING,
+    'email_verified': DATETIME,
+    'created_at': DATETIME,
+    'updated_at': DATETIME,
+    'merged_at': DATETIME,
+    'has_notifications': np.dtype(np.bool_),
+    'num_posts': np.dtype(np.int32),
+    'num_comments': np.dtype(np.int32),
+    'num_notifications': np.dtype(np.int32),
+    'num_following': np.dtype(np.int32),
+    'num_followers': np.dtype(np.int32),
+    'post_length': np.dtype(np.int32),
+    'label': pd.Int8Dtype(),
+    'latest_post_label': pd.Int8Dtype(),
+    'latest_post_at': DATETIME,
+    'month': pd.Int8Dtype(),
+}
+
+# Date fields of Merged and of the documents embedded in it
+DATETIME_FIELDS = [field for field, dtype in MERGED_SCHEMA.items() if dtype == DATETIME]
+
+
+def to_datetime(values):
+    """datetime64[us] array from BSON datetimes, legacy 'YYYY-MM-DD HH:MM:SS' strings, 'None' or None."""
+    # Aware datetimes are converted to UTC; naive ones (what pymongo returns) are already UTC
+    parsed = pd.to_datetime(pd.Series(values, dtype=object), errors='coerce', utc=True, format='ISO8601')
+    return parsed.dt.tz_localize(None).to_numpy(DATETIME)
+
+
+def column(values, field):
+    """Array of the values of `field` (a list of BSON values) in its canonical dtype."""
+    dtype = MERGED_SCHEMA.get(field)
+    if dtype is None:
+        array = np.empty(len(values), dtype=object)
+        array[:] = values
+        return array
+    if dtype == DATETIME:
+        return to_datetime(values)
+    if isinstance(dtype, np.dtype):
+        try:
+            return np.fromiter(values, dtype=dtype, count=len(values))
+        except (TypeError, ValueError):
+            # A null count or flag (e.g. in a legacy document) reads as 0 / False instead of failing the load
+            return np.fromiter((0 if value is None or value != value else value for value in values),
+                               dtype=dtype, count=len(values))
+    return pd.array(values, dtype=dtype)
+
+
+def concat(chunks, field):
+    """Concatenate the column() chunks of one field."""
+    if not chunks:
+        return column([], field)
+    if isinstance(chunks[0], np.ndarray):
+        return np.concatenate(chunks)
+    return type(chunks[0])._concat_same_type(chunks)
+
+
+def coerce_document(document):
+    """Store the date fields of a document as native datetimes (None when missing) before it is written."""
+    for field in DATETIME_FIELDS:
+        value = document.get(field)
+        if isinstance(value, str):
+            # Documents ingested before dates were native hold their str() or the literal 'None'
+            try:
+                document[field] = datetime.fromisoformat(value)
+            except ValueError:
+                document[field] = None
+    return document
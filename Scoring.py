@@ -0,0 +1,294 @@
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+from pymongo import MongoClient
+
+from Data_Loader import frame_from_documents
+from Feature_Store import FeatureStore
+from Model_Registry import ModelRegistry
+from Social_Graph import GRAPH_FEATURES, join_graph_features, load_graph_features
+
+
+class LatencyStats:
+    """Rolling request latencies (ms) and overall throughput."""
+
+    def __init__(self, window=10000):
+        self.latencies = deque(maxlen=window)
+        self.documents = 0
+        self.started = time.perf_counter()
+
+    def record(self, seconds, n_documents):
+        self.latencies.append(seconds * 1000)
+        self.documents += n_documents
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started
+        latencies = np.asarray(self.latencies) if self.latencies else np.zeros(1)
+        return {
+            'requests': len(self.latencies),
+            'documents': self.documents,
+            'p50_ms': float(np.percentile(latencies, 50)),
+            'p99_ms': float(np.percentile(latencies, 99)),
+            'docs_per_sec': self.documents / elapsed if elapsed > 0 else 0.0,
+        }
+
+
+class BatchScorer:
+    """A registered model plus its feature pipeline, loaded once and reused for every batch."""
+
+    def __init__(self, model_name='RandomForestClassifier', registry=None, db=None):
+        entry = (registry or ModelRegistry()).load(model_name)
+        if entry is None:
+            raise ValueError(f"No trained model named {model_name!r} in the registry; run ML.py first.")
+        self.name = model_name
+        self.model = entry['model']
+        self.feature_columns = entry['feature_columns']
+        # Models trained on the feature store reuse the stored vectors of the users instead of recomputing them
+        self.feature_set = entry.get('feature_set')
+        if self.feature_set is not None and db is None:
+            raise ValueError(f"Model {model_name!r} reads feature set {self.feature_set}; a database is needed.")
+        self.store = FeatureStore(db) if self.feature_set is not None else None
+        # Users missing from the store are featurized through the pipeline frozen with the feature set
+        self.pipeline = self.store.pipeline(self.store.feature_set(self.feature_set)) if self.store else None
+        self.db = db
+        self.sentiment = None
+        # Graph features come from the persisted social graph, looked up by user_id
+        self.document_columns = [column for column in self.feature_columns if column not in GRAPH_FEATURES]
+        self.graph = (load_graph_features() if self.pipeline is not None
+                      or len(self.document_columns) < len(self.feature_columns) else None)
+
+    def score(self, documents):
+        """Labels and misleading-class probabilities for Merged-shaped user documents."""
+        if not documents:
+            return []
+        if self.store is not None:
+            return self._score_stored(documents)
+        if self.graph is None:
+            features = frame_from_documents(documents, self.feature_columns)
+        else:
+            features = frame_from_documents(documents, ['user_id'] + self.document_columns)
+            features = join_graph_features(features, self.graph)[self.feature_columns]
+        return self._results(documents, features)
+
+    def _score_stored(self, documents):
+        rows, matrix = self.store.read(self.feature_set, {document.get('user_id') for document in documents})
+        position = {user_id: i for i, user_id in enumerate(rows['user_id'])}
+        found = [i for i, document in enumerate(documents) if document.get('user_id') in position]
+        missing = [i for i, document in enumerate(documents) if document.get('user_id') not in position]
+        results = [None] * len(documents)
+        if found:
+            features = pd.DataFrame(matrix[[position[documents[i].get('user_id')] for i in found]],
+                                    columns=self.feature_columns)
+            for i, result in zip(found, self._results([documents[i] for i in found], features)):
+                results[i] = result
+        # Users merged after the last feature selection are computed from their documents
+        if missing and self.pipeline is not None:
+            features = pd.DataFrame(self._transform([documents[i] for i in missing]).toarray(),
+                                    columns=self.feature_columns)
+            for i, result in zip(missing, self._results([documents[i] for i in missing], features)):
+                results[i] = result
+        elif missing:
+            for i in missing:
+                results[i] = {'user_id': documents[i].get('user_id'), 'label': None, 'probability': None,
+                              'error': f"not in feature set {self.feature_set}, which has no stored pipeline; "
+                                       f"rerun FeatureSelection.py"}
+        return results
+
+    def _transform(self, documents):
+        # Heavy modules (scikit-learn, the sentiment lexicon) are only loaded once a user needs them
+        from FeatureSelection import FEATURE_FIELDS, prepare_frame, transform_selected
+        from Sentiment import SentimentScorer
+
+        if self.sentiment is None:
+            self.sentiment = SentimentScorer(cache=self.db['Sentiment'])
+        df = prepare_frame(frame_from_documents(documents, FEATURE_FIELDS), self.graph)
+        return transform_selected(df, self.sentiment, self.pipeline)
+
+    def _results(self, documents, features):
+        labels = self.model.predict(features)
+        if hasattr(self.model, 'predict_proba'):
+            if 1 in self.model.classes_:
+                probabilities = self.model.predict_proba(features)[:, list(self.model.classes_).index(1)]
+            else:
+                # A model that never saw a misleading post gives it probability 0
+                probabilities = np.zeros(len(documents))
+        else:
+            probabilities = [None] * len(documents)
+        return [{'user_id': document.get('user_id'), 'label': int(label),
+                 'probability': None if probability is None else float(probability)}
+                for document, label, probability in zip(documents, labels, probabilities)]
+
+
+class MicroBatcher:
+    """Coalesces concurrent requests into one model call of up to max_batch documents.
+
+    A batch is flushed when it is full or max_wait_ms after its first request arrived.
+    """
+
+    def __init__(self, scorer, max_batch=512, max_wait_ms=5):
+        self.scorer = scorer
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.queue = asyncio.Queue()
+        self.stats = LatencyStats()
+
+    async def submit(self, documents):
+        start = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((documents, future))
+        results = await future
+        self.stats.record(time.perf_counter() - start, len(documents))
+        return results
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = [await self.queue.get()]
+            size = len(pending[0][0])
+            deadline = loop.time() + self.max_wait
+            while size < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    pending.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+                size += len(pending[-1][0])
+
+            documents = [document for request, _ in pending for document in request]
+            try:
+                # Scoring is CPU bound; keep the event loop free to accept requests meanwhile
+                results = await loop.run_in_executor(None, self.scorer.score, documents)
+            except Exception as error:
+                for _, future in pending:
+                    future.set_exception(error)
+                continue
+            offset = 0
+            for request, future in pending:
+                future.set_result(results[offset:offset + len(request)])
+                offset += len(request)
+
+
+async def _respond(writer, status, payload):
+    body = json.dumps(payload).encode('utf-8')
+    writer.write(f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode('ascii') + body)
+    await writer.drain()
+
+
+async def _read_request(reader):
+    # Minimal HTTP/1.1: POST /score with a JSON list of documents (or {"documents": [...]}), GET /stats
+    request_line = (await reader.readline()).decode('latin-1').split()
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode('latin-1').strip()
+        if not line:
+            break
+        key, _, value = line.partition(':')
+        headers[key.strip().lower()] = value.strip()
+    method, path = request_line[0], request_line[1]
+    documents = None
+    if method == 'POST' and path == '/score':
+        payload = json.loads(await reader.readexactly(int(headers.get('content-length', 0))))
+        documents = payload['documents'] if isinstance(payload, dict) else payload
+        if not isinstance(documents, list) or not all(isinstance(document, dict) for document in documents):
+            raise ValueError("expected a JSON list of documents")
+    return method, path, documents
+
+
+async def _handle(batcher, reader, writer):
+    try:
+        try:
+            method, path, documents = await _read_request(reader)
+        except (ValueError, KeyError, IndexError, asyncio.IncompleteReadError) as error:
+            return await _respond(writer, '400 Bad Request', {'error': str(error) or type(error).__name__})
+        if method == 'GET' and path == '/stats':
+            return await _respond(writer, '200 OK', batcher.stats.summary())
+        if documents is None:
+            return await _respond(writer, '404 Not Found', {'error': 'use POST /score or GET /stats'})
+        try:
+            results = await batcher.submit(documents)
+        except Exception as error:
+            # e.g. a document with a null count; the client gets an error and the server keeps serving
+            return await _respond(writer, '500 Internal Server Error', {'error': f"{type(error).__name__}: {error}"})
+        await _respond(writer, '200 OK', results)
+    except ConnectionError:
+        # The client went away before the reply was written
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(scorer, host='127.0.0.1', port=8080, max_batch=512, max_wait_ms=5):
+    batcher = MicroBatcher(scorer, max_batch, max_wait_ms)
+    worker = asyncio.create_task(batcher.run())
+    server = await asyncio.start_server(lambda r, w: _handle(batcher, r, w), host, port)
+    print(f"Scoring with {scorer.name} on http://{host}:{port}/score")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        worker.cancel()
+
+
+def read_documents(path):
+    """A JSON list of documents or one JSON document per line."""
+    with (sys.stdin if path == '-' else open(path)) as f:
+        text = f.read()
+    text = text.strip()
+    if text.startswith('['):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def score_file(scorer, path, batch_size=512):
+    documents = read_documents(path)
+    stats = LatencyStats()
+    for start in range(0, len(documents), batch_size):
+        batch = documents[start:start + batch_size]
+        begin = time.perf_counter()
+        for result in scorer.score(batch):
+            print(json.dumps(result))
+        stats.record(time.perf_counter() - begin, len(batch))
+    print(json.dumps(stats.summary()), file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score Merged-shaped user documents with a registered model.")
+    parser.add_argument("--model", default="RandomForestClassifier", help="name of the model in the registry")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017/",
+                        help="database holding the feature store, for models trained on it")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    score_parser = subparsers.add_parser("score", help="score a JSON/JSON-lines file and print one result per line")
+    score_parser.add_argument("input", help="input file, or - for stdin")
+    score_parser.add_argument("--batch-size", type=int, default=512)
+
+    serve_parser = subparsers.add_parser("serve", help="serve POST /score over HTTP with micro-batching")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8080)
+    serve_parser.add_argument("--max-batch", type=int, default=512, help="documents per model call")
+    serve_parser.add_argument("--max-wait-ms", type=float, default=5, help="time a request waits for others")
+    args = parser.parse_args()
+
+    # The client connects lazily, so models that do not use the feature store never touch the database
+    client = MongoClient(args.mongo_uri, connect=False)
+    scorer = BatchScorer(args.model, db=client['Tweet'])
+    try:
+        if args.command == "score":
+            score_file(scorer, args.input, args.batch_size)
+        else:
+            asyncio.run(serve(scorer, args.host, args.port, args.max_batch, args.max_wait_ms))
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
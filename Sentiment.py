@@ -0,0 +1,83 @@
+import hashlib
+from functools import lru_cache
+from multiprocessing import Pool
+
+import numpy as np
+from pymongo import UpdateOne
+
+# Number of hashes per $in lookup and documents per bulk write against the cache
+CACHE_BATCH = 10000
+
+
+@lru_cache(maxsize=1)
+def _pattern_sentiment():
+    # textblob pulls in nltk (seconds of imports), so it is only imported once a text is scored
+    from textblob.en import sentiment
+
+    return sentiment
+
+
+def _load_lexicon():
+    # The Pattern lexicon behind TextBlob is loaded lazily on first use; load it once up
+    # front so forked workers inherit it instead of parsing the XML themselves
+    _pattern_sentiment().load()
+
+
+def polarity(text):
+    """Same value as TextBlob(text).sentiment.polarity without building a TextBlob."""
+    return _pattern_sentiment()(text)[0]
+
+
+def text_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class SentimentScorer:
+    """Scores lists of texts, reusing polarities cached in a MongoDB collection.
+
+    Only texts whose content hash is not in the cache are scored, in a pool of
+    `processes` workers when given, and the new scores are written back.
+    """
+
+    def __init__(self, cache=None, processes=None, chunksize=1000):
+        self.cache = cache
+        self.processes = processes
+        self.chunksize = chunksize
+        _load_lexicon()
+
+    def _lookup(self, hashes):
+        scores = {}
+        if self.cache is None:
+            return scores
+        for start in range(0, len(hashes), CACHE_BATCH):
+            for doc in self.cache.find({"_id": {"$in": hashes[start:start + CACHE_BATCH]}}):
+                scores[doc["_id"]] = doc["polarity"]
+        return scores
+
+    def _store(self, scores):
+        if self.cache is None or not scores:
+            return
+        items = list(scores.items())
+        for start in range(0, len(items), CACHE_BATCH):
+            self.cache.bulk_write([UpdateOne({"_id": h}, {"$set": {"polarity": p}}, upsert=True)
+                                   for h, p in items[start:start + CACHE_BATCH]], ordered=False)
+
+    def _compute(self, texts):
+        if not self.processes or self.processes < 2 or len(texts) < self.chunksize:
+            return [polarity(text) for text in texts]
+        with Pool(self.processes) as pool:
+            return pool.map(polarity, texts, chunksize=self.chunksize)
+
+    def score(self, texts):
+        """Polarity in [-1, 1] of every text, as a float64 array."""
+        texts = ["" if text is None else str(text) for text in texts]
+        hashes = [text_hash(text) for text in texts]
+        unique = dict(zip(hashes, texts))
+        scores = self._lookup(list(unique))
+
+        missing = [h for h in unique if h not in scores]
+        new_scores = dict(zip(missing, self._compute([unique[h] for h in missing])))
+        self._store(new_scores)
+        scores.update(new_scores)
+
+        return np.fromiter((scores[h] for h in hashes), dtype=np.float64, count=len(hashes))
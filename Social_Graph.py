@@ -0,0 +1,332 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pymongo
+
+from Id_Lists import id_count
+from Instrumentation import stage
+
+# Persisted graph, next to the scripts; updated incrementally from the Users/Posts _id watermarks
+GRAPH_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'graph', 'social_graph.npz')
+
+# Per-user columns produced by SocialGraph.features()
+GRAPH_FEATURES = ['pagerank', 'reciprocity', 'like_ring_density', 'follower_in_degree', 'likes_received']
+
+# Rows of the like graph multiplied at once when counting triangles; bounds the intermediate product
+TRIANGLE_BLOCK_ROWS = 2048
+
+# Updates an edge waits for its missing endpoint user before it is dropped (a day of 15-minute cycles)
+PENDING_MAX_CYCLES = 96
+
+# scipy is imported by the methods that build matrices: scoring only reads the persisted features
+
+
+def _keys(values):
+    """Concatenate packed or list-valued id fields into one S24 array of hex keys, with per-value counts."""
+    parts = [value.hex().encode('ascii') if isinstance(value, (bytes, bytearray)) else ''.join(value).encode('ascii')
+             for value in values if value]
+    keys = np.frombuffer(b''.join(parts), dtype='S24') if parts else np.empty(0, dtype='S24')
+    counts = np.fromiter((id_count(value) for value in values), dtype=np.int64, count=len(values))
+    return keys, counts
+
+
+class SocialGraph:
+    """Follow and like graph over the users, stored as edge arrays and turned into CSR matrices on demand.
+
+    Nodes are numbered in arrival order, so adding users never renumbers existing ones. Edges whose
+    endpoint is not a known user yet are kept pending and resolved when that user arrives, or dropped
+    after PENDING_MAX_CYCLES updates. Users and edges are staged batch by batch and added in one flush()
+    per update, so the key index is rebuilt and the pending edges are looked up once per update.
+    """
+
+    def __init__(self):
+        self.node_keys = np.empty(0, dtype='S24')
+        self._order = np.empty(0, dtype=np.int64)
+        self._sorted_keys = np.empty(0, dtype='S24')
+        # Users and (source, target) edges waiting for the next flush()
+        self._staged = {'users': [], 'follow': [], 'like': []}
+        self.follow = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+        self.like = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+        # (source keys, target keys, update cycle the edge arrived in)
+        self.pending_follow = (np.empty(0, dtype='S24'), np.empty(0, dtype='S24'), np.empty(0, dtype=np.int64))
+        self.pending_like = (np.empty(0, dtype='S24'), np.empty(0, dtype='S24'), np.empty(0, dtype=np.int64))
+        self.cycle = 0
+        self.watermarks = {}
+        self.ranks = np.empty(0)
+        self._features = None
+
+    @property
+    def n_nodes(self):
+        return len(self.node_keys)
+
+    def _reindex(self):
+        self._order = np.argsort(self.node_keys, kind='stable')
+        self._sorted_keys = self.node_keys[self._order]
+
+    def lookup(self, keys):
+        """Node index of each key, -1 for unknown users."""
+        keys = np.asarray(keys, dtype='S24')
+        if not self.n_nodes or not len(keys):
+            return np.full(len(keys), -1, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self._sorted_keys, keys), self.n_nodes - 1)
+        return np.where(self._sorted_keys[positions] == keys, self._order[positions], -1)
+
+    def _resolve(self, edges, pending, sources, targets, retry_pending):
+        # Pending edges can only resolve when users were added, so they are looked up again only then
+        since = np.full(len(sources), self.cycle, dtype=np.int64)
+        if retry_pending:
+            since = np.concatenate([pending[2], since])
+            sources = np.concatenate([pending[0], sources])
+            targets = np.concatenate([pending[1], targets])
+        source_nodes, target_nodes = self.lookup(sources), self.lookup(targets)
+        known = (source_nodes >= 0) & (target_nodes >= 0)
+        edges = (np.concatenate([edges[0], source_nodes[known]]), np.concatenate([edges[1], target_nodes[known]]))
+        unresolved = (sources[~known], targets[~known], since[~known])
+        if not retry_pending:
+            unresolved = tuple(np.concatenate([old, new]) for old, new in zip(pending, unresolved))
+        return edges, unresolved
+
+    def expire_pending(self, max_cycles=PENDING_MAX_CYCLES):
+        """Drop the pending edges that waited more than max_cycles updates; returns how many."""
+        expired = 0
+        for name in ('pending_follow', 'pending_like'):
+            sources, targets, since = getattr(self, name)
+            keep = self.cycle - since <= max_cycles
+            expired += int(np.count_nonzero(~keep))
+            setattr(self, name, (sources[keep], targets[keep], since[keep]))
+        return expired
+
+    def stage_users(self, user_ids, following):
+        """Queue users with their following lists (packed or hex lists, in the same order) for flush()."""
+        user_keys = np.asarray(user_ids, dtype='U24').astype('S24')
+        followed, counts = _keys(following)
+        self._staged['users'].append(user_keys)
+        self._staged['follow'].append((np.repeat(user_keys, counts), followed))
+
+    def stage_likes(self, author_ids, liked):
+        """Queue the likes of posts for flush(): an edge from every liker to the post's author."""
+        author_keys = np.asarray(author_ids, dtype='U24').astype('S24')
+        likers, counts = _keys(liked)
+        self._staged['like'].append((likers, np.repeat(author_keys, counts)))
+
+    def flush(self):
+        """Add the staged users, then resolve the staged edges (and the pending ones if users were added)."""
+        added = False
+        if self._staged['users']:
+            user_keys = np.unique(np.concatenate(self._staged['users']))
+            new_keys = user_keys[self.lookup(user_keys) < 0]
+            if len(new_keys):
+                self.node_keys = np.concatenate([self.node_keys, new_keys])
+                self._reindex()
+                added = True
+        for name in ('follow', 'like'):
+            staged = self._staged[name]
+            if not staged and not added:
+                continue
+            sources = np.concatenate([edge[0] for edge in staged]) if staged else np.empty(0, dtype='S24')
+            targets = np.concatenate([edge[1] for edge in staged]) if staged else np.empty(0, dtype='S24')
+            edges, pending = self._resolve(getattr(self, name), getattr(self, f'pending_{name}'),
+                                           sources, targets, retry_pending=added)
+            setattr(self, name, edges)
+            setattr(self, f'pending_{name}', pending)
+        self._staged = {'users': [], 'follow': [], 'like': []}
+        self._features = None
+
+    def add_users(self, user_ids, following):
+        """Add users with their following lists (packed or hex lists), in the same order."""
+        self.stage_users(user_ids, following)
+        self.flush()
+
+    def add_likes(self, author_ids, liked):
+        """Add the likes of posts: an edge from every liker to the post's author."""
+        self.stage_likes(author_ids, liked)
+        self.flush()
+
+    def update(self, db, batch_size=10000):
+        """Add the Users and Posts inserted since the last update; returns the number of new documents."""
+        self.cycle += 1
+        added = 0
+        for collection_name, fields in [('Users', ['user_id', 'following_ids']), ('Posts', ['user_id', 'liked_ids'])]:
+            query = {}
+            if self.watermarks.get(collection_name) is not None:
+                query = {'_id': {'$gt': self.watermarks[collection_name]}}
+            cursor = db[collection_name].find(query, {field: 1 for field in fields},
+                                              batch_size=batch_size).sort('_id', pymongo.ASCENDING)
+            batch = []
+            for document in cursor:
+                batch.append(document)
+                if len(batch) == batch_size:
+                    added += self._add_batch(collection_name, batch, fields)
+                    batch = []
+            if batch:
+                added += self._add_batch(collection_name, batch, fields)
+        self.flush()
+        self.expire_pending()
+        return added
+
+    def _add_batch(self, collection_name, batch, fields):
+        owners = [document.get('user_id') for document in batch]
+        lists = [document.get(fields[1]) for document in batch]
+        if collection_name == 'Users':
+            self.stage_users(owners, lists)
+        else:
+            self.stage_likes(owners, lists)
+        self.watermarks[collection_name] = batch[-1]['_id']
+        return len(batch)
+
+    def follow_matrix(self):
+        """Binary CSR matrix with a 1 at (u, v) when u follows v (self-follows dropped)."""
+        from scipy import sparse
+
+        n = self.n_nodes
+        source, target = self.follow
+        distinct = source != target
+        matrix = sparse.csr_matrix((np.ones(np.count_nonzero(distinct)), (source[distinct], target[distinct])),
+                                   shape=(n, n))
+        matrix.sum_duplicates()
+        matrix.data[:] = 1
+        return matrix
+
+    def like_matrix(self):
+        """CSR matrix counting the likes from u on posts of v."""
+        from scipy import sparse
+
+        n = self.n_nodes
+        matrix = sparse.csr_matrix((np.ones(len(self.like[0]), dtype=np.float64), self.like), shape=(n, n))
+        matrix.sum_duplicates()
+        return matrix
+
+    def pagerank(self, damping=0.85, tol=1e-8, max_iter=100):
+        """PageRank over follow edges, warm-started from the previous ranks after incremental updates."""
+        from scipy import sparse
+
+        n = self.n_nodes
+        if not n:
+            return np.empty(0)
+        follow = self.follow_matrix()
+        out_degree = np.asarray(follow.sum(axis=1)).ravel()
+        dangling = out_degree == 0
+        # Row-normalized transition matrix, transposed so that ranks flow from follower to followed
+        transition = (sparse.diags(np.where(dangling, 0, 1 / np.maximum(out_degree, 1))) @ follow).T.tocsr()
+
+        ranks = np.full(n, 1 / n)
+        ranks[:len(self.ranks)] = self.ranks[:n] * len(self.ranks) / n
+        ranks /= ranks.sum()
+        for _ in range(max_iter):
+            updated = damping * (transition @ ranks) + (damping * ranks[dangling].sum() + 1 - damping) / n
+            converged = np.abs(updated - ranks).sum() < tol
+            ranks = updated
+            if converged:
+                break
+        self.ranks = ranks
+        return ranks
+
+    def reciprocity(self):
+        """Share of each user's follows that are followed back (0 for users following nobody)."""
+        follow = self.follow_matrix()
+        mutual = np.asarray(follow.multiply(follow.T).sum(axis=1)).ravel()
+        out_degree = np.asarray(follow.sum(axis=1)).ravel()
+        return np.divide(mutual, out_degree, out=np.zeros(self.n_nodes), where=out_degree > 0)
+
+    def like_ring_density(self, block_rows=TRIANGLE_BLOCK_ROWS):
+        """Local clustering of the undirected like graph: how densely the users a user trades likes with
+        also like each other."""
+        likes = self.like_matrix()
+        undirected = ((likes + likes.T) > 0).astype(np.float64)
+        undirected.setdiag(0)
+        undirected.eliminate_zeros()
+        degree = np.asarray(undirected.sum(axis=1)).ravel()
+
+        # Triangles through each node, from (A @ A) * A computed a block of rows at a time
+        triangles = np.zeros(self.n_nodes)
+        for start in range(0, self.n_nodes, block_rows):
+            rows = undirected[start:start + block_rows]
+            triangles[start:start + block_rows] = np.asarray((rows @ undirected).multiply(rows).sum(axis=1)).ravel() / 2
+        pairs = degree * (degree - 1) / 2
+        return np.divide(triangles, pairs, out=np.zeros(self.n_nodes), where=pairs > 0)
+
+    def features(self):
+        """One row per user: GRAPH_FEATURES, with PageRank scaled so that 1 is the uniform rank."""
+        if self._features is None:
+            with stage('graph_features', rows=self.n_nodes):
+                self._features = pd.DataFrame({
+                    'user_id': self.node_keys.astype('U24'),
+                    'pagerank': self.pagerank() * self.n_nodes,
+                    'reciprocity': self.reciprocity(),
+                    'like_ring_density': self.like_ring_density(),
+                    'follower_in_degree': np.asarray(self.follow_matrix().sum(axis=0)).ravel(),
+                    'likes_received': np.asarray(self.like_matrix().sum(axis=0)).ravel(),
+                })
+        return self._features
+
+    def save(self, path=GRAPH_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        arrays = {
+            'node_keys': self.node_keys,
+            'follow_source': self.follow[0], 'follow_target': self.follow[1],
+            'like_source': self.like[0], 'like_target': self.like[1],
+            'pending_follow_source': self.pending_follow[0], 'pending_follow_target': self.pending_follow[1],
+            'pending_follow_since': self.pending_follow[2],
+            'pending_like_source': self.pending_like[0], 'pending_like_target': self.pending_like[1],
+            'pending_like_since': self.pending_like[2],
+            'cycle': np.array(self.cycle),
+            'ranks': self.ranks,
+            'watermark_names': np.array(list(self.watermarks), dtype='U16'),
+            'watermark_values': np.array([str(value) for value in self.watermarks.values()], dtype='U24'),
+        }
+        if self._features is not None:
+            for column in GRAPH_FEATURES:
+                arrays[f'feature_{column}'] = self._features[column].to_numpy()
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=GRAPH_PATH):
+        from bson import ObjectId
+
+        graph = cls()
+        with np.load(path) as stored:
+            graph.node_keys = stored['node_keys']
+            graph._reindex()
+            graph.follow = (stored['follow_source'], stored['follow_target'])
+            graph.like = (stored['like_source'], stored['like_target'])
+            graph.cycle = int(stored['cycle']) if 'cycle' in stored else 0
+            for name in ('pending_follow', 'pending_like'):
+                sources, targets = stored[f'{name}_source'], stored[f'{name}_target']
+                # Graphs saved before pending edges were aged start their wait now
+                since = stored[f'{name}_since'] if f'{name}_since' in stored else np.full(len(sources), graph.cycle)
+                setattr(graph, name, (sources, targets, since.astype(np.int64)))
+            graph.ranks = stored['ranks']
+            graph.watermarks = {name: ObjectId(value) for name, value in
+                                zip(stored['watermark_names'].tolist(), stored['watermark_values'].tolist())}
+            if 'feature_pagerank' in stored:
+                graph._features = pd.DataFrame({'user_id': graph.node_keys.astype('U24'),
+                                                **{column: stored[f'feature_{column}'] for column in GRAPH_FEATURES}})
+        return graph
+
+
+def graph_features(db, path=GRAPH_PATH):
+    """Bring the persisted graph up to date with Users/Posts and return its per-user features."""
+    graph = SocialGraph.load(path) if os.path.exists(path) else SocialGraph()
+    with stage('graph_update') as metrics:
+        metrics.rows = graph.update(db)
+    if metrics.rows or graph._features is None:
+        graph.features()
+        graph.save(path)
+    return graph.features()
+
+
+def load_graph_features(path=GRAPH_PATH):
+    """Features of the persisted graph without touching the database (empty when no graph was built)."""
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=['user_id'] + GRAPH_FEATURES)
+    return SocialGraph.load(path).features()
+
+
+def join_graph_features(df, features):
+    """Left-join the graph features on user_id; users missing from the graph get zeros."""
+    joined = df.merge(features, on='user_id', how='left')
+    joined[GRAPH_FEATURES] = joined[GRAPH_FEATURES].astype(np.float64).fillna(0.0)
+    return joined
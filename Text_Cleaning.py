@@ -0,0 +1,99 @@
+import re
+import string
+import time
+from functools import lru_cache, partial
+from multiprocessing import Pool
+
+from Instrumentation import add_timing, stage
+
+# NLTK data packages and the resource paths they provide; importing NLTK takes seconds, so it is only
+# imported, and the data only downloaded when missing, the first time a package is needed
+NLTK_RESOURCES = {
+    'stopwords': 'corpora/stopwords',
+    'punkt': 'tokenizers/punkt',
+    # word_tokenize of NLTK >= 3.8.2 reads the pickle-free punkt tables
+    'punkt_tab': 'tokenizers/punkt_tab',
+}
+
+# Tokens made of punctuation only are dropped when they are a substring of string.punctuation,
+# which matches the `w not in string.punctuation` check of the original clean_text
+PUNCTUATION = string.punctuation
+
+# Regex approximation of NLTK's Treebank tokenizer: contractions are split the same way
+# ("don't" -> "do", "n't"; "it's" -> "it", "'s"), ellipses stay one token and every other
+# punctuation character becomes its own token
+TOKEN_PATTERN = re.compile(r"\w+(?=n't\b)|n't\b|'\w+|\w+|\.\.\.|[^\w\s]")
+
+TOKENIZERS = ('regex', 'nltk')
+
+# Tokenizer used when none is passed explicitly; set to 'nltk' for exact parity with word_tokenize
+DEFAULT_TOKENIZER = 'regex'
+
+# Number of distinct texts remembered by clean_text; synthetic data recycles a small pool
+CACHE_SIZE = 1 << 16
+
+
+@lru_cache(maxsize=None)
+def ensure_nltk_data(*packages):
+    """Download the NLTK data packages that are not installed yet; checked once per process."""
+    import nltk
+
+    for package in packages:
+        try:
+            nltk.data.find(NLTK_RESOURCES[package])
+        except LookupError:
+            nltk.download(package, quiet=True)
+
+
+@lru_cache(maxsize=1)
+def stop_words():
+    """English stopwords, loaded from the NLTK corpus once per process."""
+    ensure_nltk_data('stopwords')
+    from nltk.corpus import stopwords
+
+    return frozenset(stopwords.words('english'))
+
+
+@lru_cache(maxsize=1)
+def _word_tokenize():
+    ensure_nltk_data('punkt', 'punkt_tab')
+    from nltk.tokenize import word_tokenize
+
+    return word_tokenize
+
+
+def tokenize(text, tokenizer='regex'):
+    if tokenizer == 'nltk':
+        return _word_tokenize()(text)
+    return TOKEN_PATTERN.findall(text)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _clean(text, tokenizer):
+    start = time.perf_counter()
+    stop_words_set = stop_words()
+    word_tokens = tokenize(text.lower(), tokenizer)  # Convert to lowercase
+    filtered_text = [w for w in word_tokens if w not in stop_words_set and w not in PUNCTUATION]  # Remove punctuation
+    # Only cache misses reach this point; hits cost a dictionary lookup
+    add_timing('clean_text', time.perf_counter() - start)
+    return " ".join(filtered_text)
+
+
+def clean_text(text, tokenizer=None):
+    """Lowercase, tokenize and drop stopwords/punctuation.
+
+    Use tokenizer='nltk' for output identical to NLTK's word_tokenize.
+    """
+    if text is None:
+        return ""
+    return _clean(text, tokenizer or DEFAULT_TOKENIZER)
+
+
+def clean_texts(texts, tokenizer=None, processes=None, chunksize=1000):
+    """Clean a list of texts, optionally spread over a pool of worker processes."""
+    tokenizer = tokenizer or DEFAULT_TOKENIZER
+    with stage('clean_texts', rows=len(texts)):
+        if not processes or processes < 2:
+            return [clean_text(text, tokenizer) for text in texts]
+        with Pool(processes) as pool:
+            return pool.map(partial(clean_text, tokenizer=tokenizer), texts, chunksize=chunksize)
@@ -0,0 +1,142 @@
+import json
+import os
+import time
+import zlib
+from datetime import datetime, timezone
+
+import numpy as np
+from Instrumentation import stage
+
+# scikit-learn and joblib are imported by the functions that train, so modules that only need
+# is_test_user or the report (FeatureSelection, the ML.py viewer) start without them
+
+# Report written by the headless run and rendered by the ML.py viewer
+REPORT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'reports', 'ml_report.json')
+
+
+def is_test_user(user_ids):
+    """Hash the user id so a user stays on the same side of the split in every run; incrementally
+    updated models therefore never train on test users."""
+    return user_ids.map(lambda user_id: zlib.crc32(user_id.encode('utf-8')) % 5 == 0).to_numpy(dtype=bool)
+
+
+def default_classifiers():
+    """The classifiers compared by ML.py."""
+    from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
+    from sklearn.svm import SVC
+    from sklearn.neighbors import KNeighborsClassifier
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.tree import DecisionTreeClassifier
+    from sklearn.naive_bayes import GaussianNB
+
+    return [
+        RandomForestClassifier(random_state=42),
+        GradientBoostingClassifier(random_state=42),
+        SVC(),
+        KNeighborsClassifier(),
+        LogisticRegression(),
+        DecisionTreeClassifier(random_state=42),
+        GaussianNB()
+    ]
+
+
+# Label values; partial_fit needs all of them with the first chunk
+CLASSES = np.array([0, 1])
+
+
+def streaming_classifiers():
+    """The classifiers trained chunk by chunk with partial_fit by the out-of-core mode of ML.py."""
+    from sklearn.linear_model import SGDClassifier
+    from sklearn.naive_bayes import MultinomialNB
+
+    return [
+        SGDClassifier(loss='log_loss', random_state=42),
+        MultinomialNB(),
+    ]
+
+
+def add_metrics(result, y_test, y_pred):
+    """Add the accuracy, confusion matrix and classification report of predictions to a result."""
+    from sklearn.metrics import accuracy_score, confusion_matrix, classification_report
+
+    result['accuracy'] = accuracy_score(y_test, y_pred)
+    result['confusion_matrix'] = confusion_matrix(y_test, y_pred).tolist()
+    result['classification_report'] = classification_report(y_test, y_pred, zero_division=1, output_dict=True)
+    result['classification_report_text'] = classification_report(y_test, y_pred, zero_division=1)
+    return result
+
+
+def evaluate_classifier(clf, X_train, X_test, y_train, y_test, cv=0, fit=None):
+    """Fit one classifier and return its metrics, fit/predict latency and peak memory growth.
+
+    `fit(clf, X, y)` replaces clf.fit, e.g. to update an already fitted model with a new batch, and
+    returns (clf, fitted); result['fitted'] is False when it left the model unchanged.
+    Cross-validation only runs for regular fits.
+    """
+    name = clf.__class__.__name__
+    result = {'classifier': name, 'fit_rows': len(y_train), 'incremental': fit is not None, 'fitted': True}
+
+    if cv and cv > 1 and fit is None:
+        from sklearn.base import clone
+        from sklearn.model_selection import cross_val_score
+
+        start = time.perf_counter()
+        scores = cross_val_score(clone(clf), X_train, y_train, cv=cv)
+        result['cv_scores'] = scores.tolist()
+        result['cv_mean'] = float(scores.mean())
+        result['cv_std'] = float(scores.std())
+        result['cv_seconds'] = time.perf_counter() - start
+
+    # Peak memory is the rise of the peak RSS during each stage (None where it cannot be measured),
+    # read from /proc so that, unlike tracemalloc, it does not slow down the timed calls
+    with stage(f'fit.{name}', rows=len(y_train)) as metrics:
+        start = time.perf_counter()
+        if fit is None:
+            clf.fit(X_train, y_train)
+        else:
+            clf, result['fitted'] = fit(clf, X_train, y_train)
+        result['fit_seconds'] = time.perf_counter() - start
+        fit_peak = metrics.peak_rss_growth()
+
+    with stage(f'predict.{name}', rows=len(y_test)) as metrics:
+        start = time.perf_counter()
+        y_pred = clf.predict(X_test)
+        result['predict_seconds'] = time.perf_counter() - start
+        predict_peak = metrics.peak_rss_growth()
+
+    result['fit_peak_mb'] = None if fit_peak is None else fit_peak / 2**20
+    result['predict_peak_mb'] = None if predict_peak is None else predict_peak / 2**20
+    result['predict_us_per_row'] = 1e6 * result['predict_seconds'] / max(len(y_pred), 1)
+    return add_metrics(result, y_test, y_pred), clf
+
+
+def train_jobs(jobs, X_test, y_test, n_jobs=-1, cv=0):
+    """Run (clf, X_train, y_train, fit) jobs concurrently; returns (results, fitted classifiers) in job order."""
+    from joblib import Parallel, delayed
+
+    outputs = Parallel(n_jobs=n_jobs)(
+        delayed(evaluate_classifier)(clf, X_train, X_test, y_train, y_test, cv, fit)
+        for clf, X_train, y_train, fit in jobs
+    )
+    results = [result for result, _ in outputs]
+    fitted = [clf for _, clf in outputs]
+    return results, fitted
+
+
+def train_all(X_train, X_test, y_train, y_test, classifiers=None, n_jobs=-1, cv=0):
+    """Fit the classifiers concurrently; returns (results, fitted classifiers) in input order."""
+    classifiers = default_classifiers() if classifiers is None else classifiers
+    return train_jobs([(clf, X_train, y_train, None) for clf in classifiers], X_test, y_test, n_jobs, cv)
+
+
+def write_report(results, path=REPORT_PATH, **metadata):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    report = {'created_at': datetime.now(timezone.utc).isoformat(), **metadata, 'results': results}
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    return path
+
+
+def load_report(path=REPORT_PATH):
+    with open(path) as f:
+        return json.load(f)
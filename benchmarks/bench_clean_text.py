@@ -0,0 +1,83 @@
+"""Throughput and output parity of Text_Cleaning against the original clean_text.
+
+Run from the repository root:
+
+    python benchmarks/bench_clean_text.py --n-posts 20000 --processes 4
+"""
+import argparse
+import os
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nltk.corpus import stopwords
+from nltk.tokenize import word_tokenize
+
+import Text_Cleaning
+from Data_Generator import DataGenerator
+
+
+# The clean_text that Data_Preprocessing shipped with, kept as the reference implementation
+def original_clean_text(text):
+    if text is None:
+        return ""
+    stop_words = set(stopwords.words('english'))
+    word_tokens = word_tokenize(text.lower())  # Convert to lowercase
+    filtered_text = [w for w in word_tokens if w not in stop_words and w not in string.punctuation]  # Remove punctuation
+    return " ".join(filtered_text)
+
+
+def sample_texts(n_users, n_posts, seed):
+    generator = DataGenerator(n_users=n_users, n_posts=n_posts, n_comments=0, n_notifications=0,
+                              seed=seed, chunk_size=max(n_users, n_posts))
+    texts = []
+    for chunk in generator.iter_users():
+        texts.extend(chunk['bio'].tolist())
+    for chunk in generator.iter_posts():
+        texts.extend(chunk['body'].tolist())
+    return texts
+
+
+def measure(name, func, texts, reference=None):
+    start = time.perf_counter()
+    output = func(texts)
+    elapsed = time.perf_counter() - start
+    n_tokens = sum(len(text.split()) for text in output)
+    parity = 1.0 if reference is None else sum(a == b for a, b in zip(output, reference)) / len(reference)
+    print(f"{name:<28}{elapsed:>9.3f}s{n_tokens / elapsed:>15,.0f}{parity:>10.2%}")
+    return output, parity
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--n-users", type=int, default=5000)
+    parser.add_argument("--n-posts", type=int, default=5000)
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--min-parity", type=float, default=0.99,
+                        help="fail when the regex tokenizer matches fewer outputs than this")
+    args = parser.parse_args()
+
+    # The reference implementation reads the NLTK data directly
+    Text_Cleaning.ensure_nltk_data('stopwords', 'punkt', 'punkt_tab')
+    texts = sample_texts(args.n_users, args.n_posts, args.seed)
+    print(f"{len(texts)} texts")
+    print(f"{'implementation':<28}{'time':>10}{'tokens/sec':>15}{'parity':>10}")
+
+    reference, _ = measure("original (per call)", lambda t: [original_clean_text(x) for x in t], texts)
+    measure("nltk tokenizer", lambda t: Text_Cleaning.clean_texts(t, tokenizer='nltk'), texts, reference)
+    Text_Cleaning._clean.cache_clear()
+    _, parity = measure("regex tokenizer", lambda t: Text_Cleaning.clean_texts(t, tokenizer='regex'), texts, reference)
+    measure("regex tokenizer (cached)", lambda t: Text_Cleaning.clean_texts(t, tokenizer='regex'), texts, reference)
+    Text_Cleaning._clean.cache_clear()
+    measure(f"regex x{args.processes} processes",
+            lambda t: Text_Cleaning.clean_texts(t, tokenizer='regex', processes=args.processes), texts, reference)
+
+    if parity < args.min_parity:
+        sys.exit(f"regex tokenizer parity {parity:.2%} is below {args.min_parity:.2%}")
+
+
+if __name__ == "__main__":
+    main()
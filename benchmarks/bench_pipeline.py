@@ -0,0 +1,245 @@
+"""Throughput and peak memory of each pipeline stage at a fixed scale, compared with a stored baseline.
+
+Runs generation, merge, cleaning, the social graph, feature extraction and training on seeded synthetic
+data against a scratch database on a real server (--mongo-uri), or against mongomock at the 1k scale.
+Run from the repository root:
+
+    python benchmarks/bench_pipeline.py --update-baseline                # 1k on mongomock: record the baseline
+    python benchmarks/bench_pipeline.py                                  # compare against it
+    python benchmarks/bench_pipeline.py --scale 1M --mongo-uri mongodb://localhost:27017/
+
+The process exits with status 1 when a stage is slower or uses more memory than the baseline
+allows (--tolerance). Baselines are machine specific; record one on the machine that compares.
+
+mongomock has no real indexes: every upsert of the merge scans the collection and re-checks the unique
+indexes over all of it, so the merge grows quadratically with the number of users. Measured merge times
+on mongomock: 250 users 5s, 500 users 20s, 1k users 85s (about 90s for the whole 1k run); 10k would
+take hours. Only the 1k scale runs on mongomock, and its numbers are comparable with mongomock runs
+only; the 10k, 100k and 1M scales need --mongo-uri.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Data_Preprocessing
+import Instrumentation
+import Text_Cleaning
+from Data_Generator import DataGenerator
+from Data_Loader import load_merged
+from FeatureSelection import FEATURE_FIELDS, build_feature_matrix, select_features
+from Ingestion import ingest
+from Instrumentation import stage
+from Sentiment import SentimentScorer
+from Social_Graph import GRAPH_FEATURES, SocialGraph, join_graph_features
+from Training import default_classifiers, is_test_user, train_all
+
+# Users, posts, comments and notifications per scale; the ratios of the original Data_Collection
+SCALES = {
+    '1k': (1000, 1000, 5000, 200),
+    '10k': (10000, 10000, 50000, 2000),
+    '100k': (100000, 100000, 500000, 20000),
+    '1M': (1000000, 1000000, 5000000, 200000),
+}
+
+# Scales whose merge finishes on mongomock; the others need a real server
+MONGOMOCK_SCALES = ['1k']
+
+STAGES = ['generation', 'merge', 'cleaning', 'graph', 'features', 'training']
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# Fixed clock so that the generated timestamps (and therefore every stage's input) are identical per seed
+GENERATOR_NOW = datetime(2024, 1, 1)
+
+TRAINING_FIELDS = ['user_id', 'num_posts', 'num_followers', 'num_following', 'num_comments',
+                   'has_notifications', 'label']
+
+
+def open_database(mongo_uri):
+    if mongo_uri:
+        from pymongo import MongoClient
+        client = MongoClient(mongo_uri)
+        client.drop_database('TweetBenchmark')
+        return client, client['TweetBenchmark']
+    import mongomock
+    client = mongomock.MongoClient()
+    return client, client['TweetBenchmark']
+
+
+def run_generation(db, counts, seed):
+    generator = DataGenerator(*counts, seed=seed, now=GENERATOR_NOW)
+    return sum(ingest(db[name], generator.iter_collection(name))['rows']
+               for name in ['Users', 'Posts', 'Comments', 'Notifications'])
+
+
+def run_merge(db):
+    Data_Preprocessing.ensure_indexes(db)
+    return Data_Preprocessing.merge_joined(db)
+
+
+def run_cleaning(db, processes):
+    texts = [doc.get('bio') or '' for doc in db['Users'].find({}, {'bio': 1})]
+    texts += [doc.get('body') or '' for doc in db['Posts'].find({}, {'body': 1})]
+    Text_Cleaning._clean.cache_clear()
+    Text_Cleaning.clean_texts(texts, processes=processes)
+    return len(texts)
+
+
+def run_graph(db, state):
+    graph = SocialGraph()
+    graph.update(db)
+    state['graph'] = graph.features()
+    return graph.n_nodes
+
+
+def run_features(db, processes, graph):
+    df = load_merged(db, FEATURE_FIELDS)
+    df = df[df['label'].notnull()].reset_index(drop=True)
+    df = join_graph_features(df, graph)
+    df['post_content'] = df['post_content'].fillna('missing')
+    features, _, _ = build_feature_matrix(df, SentimentScorer(processes=processes))
+    select_features(features, df['label'].to_numpy())
+    return len(df)
+
+
+def run_training(db, classifiers, n_jobs, graph):
+    df = load_merged(db, TRAINING_FIELDS)
+    df = join_graph_features(df[df['label'].notnull()], graph)
+    feature_columns = TRAINING_FIELDS[1:-1] + GRAPH_FEATURES
+    # Same split as ML.py
+    is_test = is_test_user(df['user_id'])
+    train, test = df[~is_test], df[is_test]
+    selected = [clf for clf in default_classifiers() if clf.__class__.__name__ in classifiers]
+    train_all(train[feature_columns], test[feature_columns], train['label'], test['label'],
+              classifiers=selected, n_jobs=n_jobs)
+    return len(train)
+
+
+def run_benchmark(scale, seed, mongo_uri=None, processes=None, n_jobs=1, classifiers=None):
+    """Run every stage once; returns {stage: {seconds, rows, rows_per_sec, peak_rss_bytes}}."""
+    classifiers = classifiers or [clf.__class__.__name__ for clf in default_classifiers()]
+    client, db = open_database(mongo_uri)
+    # The graph features are computed once and reused by the feature and training stages
+    state = {}
+    steps = {
+        'generation': lambda: run_generation(db, SCALES[scale], seed),
+        'merge': lambda: run_merge(db),
+        'cleaning': lambda: run_cleaning(db, processes),
+        'graph': lambda: run_graph(db, state),
+        'features': lambda: run_features(db, processes, state['graph']),
+        'training': lambda: run_training(db, classifiers, n_jobs, state['graph']),
+    }
+    results = {}
+    try:
+        for name in STAGES:
+            with stage(f'benchmark.{name}') as metrics:
+                metrics.rows = steps[name]()
+            record = Instrumentation.last_record(f'benchmark.{name}')
+            results[name] = {key: record[key] for key in ['seconds', 'rows', 'rows_per_sec', 'peak_rss_bytes']}
+            peak = f"{record['peak_rss_bytes'] / 2**20:>12,.0f}" if record['peak_rss_bytes'] else f"{'n/a':>12}"
+            print(f"{name:<12}{record['seconds']:>10.2f}s{record['rows']:>12,}{record['rows_per_sec']:>14,.0f}{peak}")
+    finally:
+        if mongo_uri:
+            client.drop_database('TweetBenchmark')
+        client.close()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Regressions as messages: throughput below, or peak memory above, the baseline by more than tolerance."""
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if not reference:
+            continue
+        if result['rows_per_sec'] < reference['rows_per_sec'] * (1 - tolerance):
+            regressions.append(f"{name}: {result['rows_per_sec']:,.0f} rows/s, baseline "
+                               f"{reference['rows_per_sec']:,.0f} rows/s")
+        # Peak memory is not measured on every platform
+        if not result['peak_rss_bytes'] or not reference.get('peak_rss_bytes'):
+            continue
+        if result['peak_rss_bytes'] > reference['peak_rss_bytes'] * (1 + tolerance):
+            regressions.append(f"{name}: peak RSS {result['peak_rss_bytes'] / 2**20:,.0f} MB, baseline "
+                               f"{reference['peak_rss_bytes'] / 2**20:,.0f} MB")
+    return regressions
+
+
+def load_baselines(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(path, scale, seed, backend, results):
+    baselines = load_baselines(path)
+    baselines[scale] = {
+        'recorded_at': datetime.now(timezone.utc).isoformat(),
+        'seed': seed,
+        'backend': backend,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'stages': results,
+    }
+    with open(path, 'w') as f:
+        json.dump(baselines, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", choices=SCALES, default="1k",
+                        help="1k runs on mongomock; larger scales need --mongo-uri")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mongo-uri", default=None,
+                        help="run against a scratch database on this server instead of mongomock")
+    parser.add_argument("--processes", type=int, default=None, help="worker processes for cleaning and sentiment")
+    parser.add_argument("--n-jobs", type=int, default=1, help="classifiers trained in parallel")
+    parser.add_argument("--classifiers", default=None,
+                        help="comma-separated classifier names to train (default: all of Training.py)")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true", help="store this run as the baseline of the scale")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown / memory growth")
+    parser.add_argument("--output", default=None, help="also write this run's results to a JSON file")
+    args = parser.parse_args()
+    if not args.mongo_uri and args.scale not in MONGOMOCK_SCALES:
+        parser.error(f"the {args.scale} scale needs --mongo-uri: the merge on mongomock is quadratic and "
+                     f"would not finish")
+
+    # Keep benchmark records out of the pipeline's metrics log
+    Instrumentation.configure(log_path=os.devnull)
+
+    backend = 'mongodb' if args.mongo_uri else 'mongomock'
+    print(f"scale {args.scale} ({', '.join(f'{n:,}' for n in SCALES[args.scale])}), seed {args.seed}, {backend}")
+    print(f"{'stage':<12}{'time':>11}{'rows':>12}{'rows/sec':>14}{'peak MB':>12}")
+    classifiers = args.classifiers.split(',') if args.classifiers else None
+    results = run_benchmark(args.scale, args.seed, args.mongo_uri, args.processes, args.n_jobs, classifiers)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'scale': args.scale, 'seed': args.seed, 'backend': backend, 'stages': results}, f, indent=2)
+
+    if args.update_baseline:
+        save_baseline(args.baseline, args.scale, args.seed, backend, results)
+        print(f"Baseline for {args.scale} written to {args.baseline}")
+        return
+
+    baseline = load_baselines(args.baseline).get(args.scale)
+    if baseline is None:
+        print(f"No baseline for {args.scale} in {args.baseline}; record one with --update-baseline")
+        return
+    regressions = compare(results, baseline['stages'], args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if regressions:
+        sys.exit(1)
+    print(f"No regressions beyond {args.tolerance:.0%} of the baseline")
+
+
+if __name__ == "__main__":
+    main()
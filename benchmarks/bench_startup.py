@@ -0,0 +1,83 @@
+"""Startup time of the entry points: importing each module, and a Pipeline.py --dry-run, in a fresh interpreter.
+
+Heavy libraries (scikit-learn, nltk/textblob, matplotlib, seaborn, wordcloud) are imported by the
+functions that need them, so importing an entry point should stay cheap. Run from the repository root:
+
+    python benchmarks/bench_startup.py                 # check every entry point against --budget
+    python benchmarks/bench_startup.py --budget 0.5 --top 10
+
+Each target is timed --repeat times and the fastest run counts, which leaves out disk cache misses.
+The process exits with status 1 when a target takes longer than the budget; --top lists the slowest
+imports (python -X importtime) of the targets over budget.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules run as scripts (or imported by them) whose import time is checked
+ENTRY_POINTS = ['Pipeline', 'Data_Collection', 'Data_Preprocessing', 'FeatureSelection', 'ML', 'EDA', 'Scoring']
+
+
+def targets():
+    """(name, argv) of every timed command."""
+    commands = [(f'import {module}', [sys.executable, '-c', f'import {module}']) for module in ENTRY_POINTS]
+    commands.append(('Pipeline.py --dry-run', [sys.executable, os.path.join(ROOT, 'Pipeline.py'), '--dry-run']))
+    return commands
+
+
+def time_command(argv, repeat):
+    """Fastest wall time of `repeat` runs of a command."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(argv, cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def slowest_imports(argv, top):
+    """The `top` modules with the largest cumulative import time, as (seconds, module)."""
+    completed = subprocess.run([argv[0], '-X', 'importtime'] + argv[1:], cwd=ROOT, check=True,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    imports = []
+    for line in completed.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        parts = line.split('|')
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            imports.append((int(parts[1]) / 1e6, parts[2].strip()))
+    return sorted(imports, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the startup of the pipeline entry points.")
+    parser.add_argument("--budget", type=float, default=1.0, help="allowed seconds per target")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=0, help="slowest imports listed for targets over budget")
+    args = parser.parse_args()
+
+    print(f"{'target':<28}{'time':>10}")
+    over_budget = []
+    for name, argv in targets():
+        seconds = time_command(argv, args.repeat)
+        flag = '  over budget' if seconds > args.budget else ''
+        print(f"{name:<28}{seconds:>9.2f}s{flag}")
+        if flag:
+            over_budget.append((name, argv))
+
+    for name, argv in over_budget if args.top else []:
+        print(f"\nSlowest imports of {name}:")
+        for seconds, module in slowest_imports(argv, args.top):
+            print(f"  {seconds:>7.3f}s  {module}")
+
+    if over_budget:
+        print(f"\n{len(over_budget)} target(s) over the {args.budget:.2f}s budget")
+        sys.exit(1)
+    print(f"\nAll targets within the {args.budget:.2f}s budget")
+
+
+if __name__ == "__main__":
+    main()